@@ -0,0 +1,291 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import titanic_data
+from titanic_filters import filter_mask
+
+# aggregation layer - turns a graph request into small summary arrays
+# so the plotting code never has to group or bin the raw rows itself
+
+# grid settings for the KDE curve drawn over histograms (same as seaborn)
+KDE_GRIDSIZE = 200
+KDE_CUT = 3
+# number of fine bins the data is binned into before smoothing
+KDE_BINS = 1024
+
+# LRU cache of aggregated plot data, bounded by (roughly) how much memory it holds
+RENDER_CACHE_MAX_BYTES = 64 * 1024 * 1024
+_render_cache = OrderedDict()
+_render_cache_bytes = 0
+_render_cache_version = 0
+_render_cache_lock = threading.Lock()
+render_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+def count_table(data, first_feature, second_feature=None):
+    # one-way counts come back as a single column table so both cases look the same
+    if not second_feature:
+        counts = data[first_feature].value_counts(sort=False).sort_index()
+        # categoricals list every category, keep only the values that are actually there
+        return counts[counts > 0].to_frame('count')
+
+    # two-way counts - rows are first feature values, columns are second feature values
+    counts = data.groupby([first_feature, second_feature], observed=True).size()
+    return counts.unstack(fill_value=0).sort_index()
+
+# bins for an empty histogram when none are given
+EMPTY_BINS = 10
+
+def auto_bin_count(n):
+    # Sturges' rule - it only needs the row count, so every backend (the databases included) picks the same bins
+    return int(np.ceil(np.log2(n))) + 1 if n > 0 else EMPTY_BINS
+
+def bin_count(bins, n):
+    # 0 or less means 'pick for me', the GUI starts the bins box at 0
+    return bins if bins and bins > 0 else auto_bin_count(n)
+
+def histogram(values, bins):
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    counts, edges = np.histogram(values, bins=bin_count(bins, values.size))
+    return counts, edges
+
+def kde_support(n, std, low, high, cut=KDE_CUT):
+    # Scott's rule bandwidth, same as seaborn's default
+    bandwidth = std * n ** (-1 / 5)
+    return bandwidth, low - cut * bandwidth, high + cut * bandwidth
+
+def smooth_binned(binned, edges, n, bandwidth, gridsize=KDE_GRIDSIZE):
+    # smooth finely binned counts with a gaussian kernel
+    # this is linear in the number of rows instead of rows * grid points
+    binned = np.asarray(binned, dtype=float)
+    centres = (edges[:-1] + edges[1:]) / 2
+    step = edges[1] - edges[0]
+    radius = min(int(np.ceil(4 * bandwidth / step)), len(binned) - 1)
+    offsets = np.arange(-radius, radius + 1) * step
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+    density = np.convolve(binned, kernel, mode='same') / n
+
+    # evaluate on the (coarser) output grid
+    grid = np.linspace(edges[0], edges[-1], gridsize)
+    return grid, np.interp(grid, centres, density)
+
+def kde_grid(values, gridsize=KDE_GRIDSIZE, cut=KDE_CUT):
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    n = values.size
+    if n < 2:
+        return None, None
+    std = values.std(ddof=1)
+    if std == 0:
+        return None, None
+
+    bandwidth, low, high = kde_support(n, std, values.min(), values.max(), cut)
+    # bin the data onto a fine grid first, then smooth the bins
+    binned, edges = np.histogram(values, bins=KDE_BINS, range=(low, high))
+    return smooth_binned(binned, edges, n, bandwidth, gridsize)
+
+def bar_aggregates(selected_graph_type, first_feature, second_feature, counts):
+    return {
+        'graph_type': selected_graph_type,
+        'first_feature': first_feature,
+        'second_feature': second_feature,
+        'counts': counts,
+    }
+
+def histogram_aggregates(first_feature, counts, edges, kde_x, kde_y):
+    if kde_y is not None:
+        # scale the density so the curve sits on top of the bars
+        kde_y = kde_y * counts.sum() * (edges[1] - edges[0])
+    return {
+        'graph_type': 'Histogram',
+        'first_feature': first_feature,
+        'hist_counts': counts,
+        'hist_edges': edges,
+        'kde_x': kde_x,
+        'kde_y': kde_y,
+    }
+
+def aggregate_graph_data(selected_graph_type, selected_first_feature, selected_second_feature, cleaned_data, selected_bins):
+    if selected_graph_type == 'Bar Plot':
+        counts = count_table(cleaned_data, selected_first_feature, selected_second_feature)
+        return bar_aggregates('Bar Plot', selected_first_feature, selected_second_feature, counts)
+
+    if selected_graph_type == 'Histogram':
+        column = cleaned_data[selected_first_feature]
+        # text columns can't be binned, count each value instead
+        if not pd.api.types.is_numeric_dtype(column):
+            counts = count_table(cleaned_data, selected_first_feature)
+            return bar_aggregates('Histogram', selected_first_feature, None, counts)
+
+        counts, edges = histogram(column, selected_bins)
+        kde_x, kde_y = kde_grid(column)
+        return histogram_aggregates(selected_first_feature, counts, edges, kde_x, kde_y)
+
+    return {'graph_type': selected_graph_type}
+
+def sampled_aggregates(selected_graph_type, selected_first_feature, selected_second_feature, sampled_data, selected_bins, scale):
+    # aggregates of a random sample - scale is roughly how many rows each sampled row stands for
+    aggregates = aggregate_graph_data(selected_graph_type, selected_first_feature, selected_second_feature, sampled_data, selected_bins)
+    aggregates['sample_scale'] = scale
+    return aggregates
+
+def scale_aggregates(aggregates, scale):
+    # estimate of the full table's counts from a sample (for previews)
+    scaled = dict(aggregates, approximate=True)
+    if 'counts' in aggregates:
+        scaled['counts'] = (aggregates['counts'] * scale).round().astype('int64')
+    if 'hist_counts' in aggregates:
+        scaled['hist_counts'] = np.round(aggregates['hist_counts'] * scale).astype(np.int64)
+    if aggregates.get('kde_y') is not None:
+        scaled['kde_y'] = aggregates['kde_y'] * scale
+    return scaled
+
+def select_rows(data, filters=(), sample=0):
+    # sample first then filter, the same as the database backends
+    # returns the rows and the sample scale (None if every row was kept)
+    scale = None
+    if sample and 0 < sample < len(data):
+        positions = np.sort(np.random.default_rng().choice(len(data), sample, replace=False))
+        scale = len(data) / sample
+        data = data.iloc[positions]
+    if filters:
+        data = data[filter_mask(data, filters)]
+    return data, scale
+
+def aggregated_rows(aggregates):
+    # how many rows went into the graph (scaled up for previews)
+    if 'counts' in aggregates:
+        return int(aggregates['counts'].values.sum())
+    if 'hist_counts' in aggregates:
+        return int(np.sum(aggregates['hist_counts']))
+    return 0
+
+def aggregates_to_json(value):
+    # plain JSON types, for sending aggregates to another process (titanic_server) - aggregates_from_json undoes it
+    if isinstance(value, pd.DataFrame):
+        return {'__frame__': {'index': value.index.tolist(), 'index_name': value.index.name, 'columns': value.columns.tolist(),
+                              'columns_name': value.columns.name, 'data': value.to_numpy().tolist()}}
+    if isinstance(value, np.ndarray):
+        return {'__array__': value.tolist(), 'dtype': value.dtype.str}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, dict):
+        return {name: aggregates_to_json(item) for name, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [aggregates_to_json(item) for item in value]
+    return value
+
+def aggregates_from_json(value):
+    if isinstance(value, dict):
+        if '__frame__' in value:
+            frame = value['__frame__']
+            return pd.DataFrame(frame['data'], index=pd.Index(frame['index'], name=frame['index_name']),
+                                columns=pd.Index(frame['columns'], name=frame['columns_name']))
+        if '__array__' in value:
+            return np.array(value['__array__'], dtype=value['dtype'])
+        return {name: aggregates_from_json(item) for name, item in value.items()}
+    if isinstance(value, list):
+        return [aggregates_from_json(item) for item in value]
+    return value
+
+def aggregates_size(aggregates):
+    size = 0
+    for value in aggregates.values():
+        if isinstance(value, np.ndarray):
+            size += value.nbytes
+        elif isinstance(value, pd.DataFrame):
+            size += int(value.memory_usage(deep=True).sum())
+        else:
+            size += 64
+    return size
+
+def render_cache_key(selected_graph_type, selected_first_feature, selected_second_feature, selected_bins, filters=(), sample=0):
+    # the palette only changes how a graph is drawn, not its data, so it isn't part of the key
+    # bins only matter for histograms
+    if selected_graph_type != 'Histogram':
+        selected_bins = None
+    return (selected_graph_type, selected_first_feature, selected_second_feature or None, selected_bins,
+            tuple(filters), sample or 0, titanic_data.data_version)
+
+def clear_render_cache():
+    global _render_cache_bytes
+    with _render_cache_lock:
+        _render_cache.clear()
+        _render_cache_bytes = 0
+
+def check_render_cache_version():
+    # data changed since the cache was filled (e.g. add_column_*) - everything in it is stale
+    # unless the change only appended rows, then the count tables are brought up to date instead
+    global _render_cache_bytes, _render_cache_version
+    if _render_cache_version != titanic_data.data_version:
+        entries = []
+        appended = titanic_data.last_appended
+        if appended is not None and appended[0] == titanic_data.data_version == _render_cache_version + 1:
+            entries = list(_render_cache.items())
+        _render_cache.clear()
+        _render_cache_bytes = 0
+        _render_cache_version = titanic_data.data_version
+        if entries:
+            apply_appended_rows(entries, appended[1])
+
+def apply_appended_rows(entries, new_rows):
+    # count tables are additive, so they only need the counts of the new rows added on
+    # histograms are dropped - their bin edges and KDE bandwidth depend on every row - and so are samples
+    global _render_cache_bytes
+    new_cleaned = titanic_data.clean_frame(new_rows)
+    for key, (aggregates, _) in entries:
+        filters, sample = key[4], key[5]
+        if 'counts' not in aggregates or sample:
+            continue
+        features = [aggregates['first_feature'], aggregates['second_feature']] + [column for column, _, _ in filters]
+        if any(feature and feature not in new_cleaned.columns for feature in features):
+            continue
+        new_selected = new_cleaned[filter_mask(new_cleaned, filters)] if filters else new_cleaned
+        if len(new_selected):
+            new_counts = count_table(new_selected, aggregates['first_feature'], aggregates['second_feature'])
+            aggregates = dict(aggregates, counts=merge_counts(aggregates['counts'], new_counts))
+        size = aggregates_size(aggregates)
+        _render_cache[key[:-1] + (_render_cache_version,)] = (aggregates, size)
+        _render_cache_bytes += size
+
+def merge_counts(counts, new_counts):
+    # line the values up and add them, values only one side has count as 0 on the other
+    merged = counts.add(new_counts, fill_value=0).fillna(0).astype('int64')
+    if merged.shape[1] > 1:
+        merged = merged.sort_index(axis=1)
+    return merged.sort_index()
+
+def get_cached_aggregates(key):
+    with _render_cache_lock:
+        check_render_cache_version()
+        entry = _render_cache.get(key)
+        if entry is None:
+            render_cache_stats['misses'] += 1
+            return None
+        _render_cache.move_to_end(key)
+        render_cache_stats['hits'] += 1
+        return entry[0]
+
+def cache_aggregates(key, aggregates):
+    global _render_cache_bytes
+    size = aggregates_size(aggregates)
+    with _render_cache_lock:
+        check_render_cache_version()
+        # built from data that has since changed, or too big to ever fit - don't keep it
+        if key[-1] != _render_cache_version or size > RENDER_CACHE_MAX_BYTES:
+            return aggregates
+        if key in _render_cache:
+            _render_cache_bytes -= _render_cache.pop(key)[1]
+        _render_cache[key] = (aggregates, size)
+        _render_cache_bytes += size
+        # evict least recently used entries until we're back under the limit
+        while _render_cache_bytes > RENDER_CACHE_MAX_BYTES:
+            _, (_, evicted_size) = _render_cache.popitem(last=False)
+            _render_cache_bytes -= evicted_size
+            render_cache_stats['evictions'] += 1
+    return aggregates
+
+def get_render_cache_stats():
+    with _render_cache_lock:
+        return dict(render_cache_stats, entries=len(_render_cache), bytes=_render_cache_bytes)
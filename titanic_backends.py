@@ -0,0 +1,694 @@
+import http.client
+import importlib.util
+import os
+import socket
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from urllib.parse import quote
+from titanic_trace import note, span
+
+# data access layer - the GUIs talk to one of these instead of holding a connection themselves
+# every backend has the same interface and can be used from any thread:
+#   columns()                   - feature names for the dropdowns
+#   load()                      - first load (or resume) from the CSV, else pick up appended rows
+#   sync()                      - pick up rows appended to the CSV (SQLite/MongoDB)
+#   aggregate(type, first, second, bins, filters, sample) - aggregated plot data,
+#                                 optionally filtered (titanic_filters) and/or from a random sample of rows
+#   render(cache_key, ...)      - aggregate() plus the render cache
+#   preview(type, first, second, bins, filters) - quick estimate from a sample, None for small tables
+#   row_estimate()              - about how many rows there are, cheaply
+#   add_column(name, default)   - add a column to every row (SQLite/MongoDB)
+#   refresh_features()          - store any derived features (titanic_features) that are missing or stale (SQLite/MongoDB)
+#   cube_counts(first, second)  - unfiltered count table from the data cube (titanic_cube), None if the cube can't answer
+#   refresh_cube()              - rebuild the data cube if it's missing or stale (SQLite/MongoDB, the CSV one comes with the columnar cache)
+#   ping(), close()
+# MemoryBackend holds the whole table in one in-memory frame, for the shared server (titanic_server),
+# and ServerBackend is the thin client the GUIs use with --server ADDRESS to ask that server instead
+# renders and previews are traced (titanic_trace) - the stages and row counts show in the GUI consoles
+# only the standard library is imported up front, the GUIs import this before the window is up
+
+# MongoClient settings - a pool big enough for a few renders and loads at once,
+# and timeouts so a missing server fails in seconds rather than hanging a worker
+MONGO_MAX_POOL_SIZE = 20
+MONGO_MIN_POOL_SIZE = 2
+MONGO_SERVER_SELECTION_TIMEOUT_MS = 5000
+MONGO_CONNECT_TIMEOUT_MS = 5000
+MONGO_SOCKET_TIMEOUT_MS = 30000
+
+# rows sampled for a preview - tables under twice this just get the exact graph
+PREVIEW_ROWS = 20000
+
+# CSVs bigger than this are aggregated chunk by chunk (titanic_stream) instead of being loaded whole
+STREAM_BYTES = 1024 ** 3
+# threads reading and aggregating chunks of a big CSV at once
+STREAM_WORKERS = 4
+
+# where titanic_server listens unless told otherwise ('unix:<path>' for a unix socket)
+DEFAULT_SERVER = 'http://127.0.0.1:8765'
+# seconds a thin client waits on the server - renders of a big table can take a while
+SERVER_TIMEOUT = 120
+
+def server_address(argv=None):
+    # --server [ADDRESS] on the command line - the GUIs become thin clients of a titanic_server
+    argv = sys.argv if argv is None else argv
+    if '--server' not in argv:
+        return None
+    position = argv.index('--server') + 1
+    if position < len(argv) and not argv[position].startswith('--'):
+        return argv[position]
+    return DEFAULT_SERVER
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    # HTTP over a unix socket, for a titanic_server started with --socket
+    def __init__(self, socket_path, timeout=SERVER_TIMEOUT):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+def mongo_compressors():
+    # wire compression, best first - zstd and snappy need their optional packages, zlib is always there
+    compressors = [name for name, module in [('zstd', 'zstandard'), ('snappy', 'snappy')] if importlib.util.find_spec(module)]
+    return compressors + ['zlib']
+
+class Backend:
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        # writes (loads, syncs, new columns) currently running
+        self.writes = 0
+        self.writes_lock = threading.Lock()
+
+    @contextmanager
+    def writing(self):
+        with self.writes_lock:
+            self.writes += 1
+        try:
+            yield
+        finally:
+            with self.writes_lock:
+                self.writes -= 1
+
+    def render(self, cache_key, selected_graph_type, selected_first_feature, selected_second_feature, selected_bins, filters=(), sample=0):
+        # aggregate and keep the result in the render cache - unless a write overlapped the query,
+        # then it may mix old and new rows and is drawn but not cached
+        from titanic_aggregate import aggregated_rows, cache_aggregates
+        import titanic_data
+        quiet = self.writes == 0
+        aggregates = self.aggregate(selected_graph_type, selected_first_feature, selected_second_feature, selected_bins, filters, sample)
+        note(rows=aggregated_rows(aggregates))
+        if quiet and self.writes == 0 and cache_key[-1] == titanic_data.data_version:
+            cache_aggregates(cache_key, aggregates)
+        return aggregates
+
+    def preview(self, selected_graph_type, selected_first_feature, selected_second_feature, selected_bins, filters=()):
+        # estimate of the full graph from PREVIEW_ROWS sampled rows, counts scaled up to the table size
+        # never cached - the exact render that follows it is
+        from titanic_aggregate import aggregated_rows, scale_aggregates
+        if self.row_estimate() < PREVIEW_ROWS * 2:
+            return None
+        # the exact counts are a lookup in the cube, nothing to estimate
+        if selected_graph_type == 'Bar Plot' and not filters and self.cube_counts(selected_first_feature, selected_second_feature) is not None:
+            return None
+        aggregates = self.aggregate(selected_graph_type, selected_first_feature, selected_second_feature, selected_bins, filters, PREVIEW_ROWS)
+        note(rows=aggregated_rows(aggregates))
+        if 'sample_scale' not in aggregates:
+            return aggregates
+        return scale_aggregates(aggregates, aggregates['sample_scale'])
+
+    def cube_counts(self, selected_first_feature, selected_second_feature=None):
+        # backends with a data cube (titanic_cube) look the counts up
+        return None
+
+    def data_changed(self, stats, complete_keys=None):
+        # after a sync - cached count tables are updated from just the new rows (if they were only appended)
+        # complete_keys - the new rows the backend's cleaned queries keep, when it can have columns the CSV
+        # doesn't (add_column) - the rest are left out, the same as the exact query leaves them out
+        from titanic_data import KEY_COLUMN, mark_data_changed
+        from titanic_features import add_features
+        if stats['rows']:
+            new_rows = stats['new_rows']
+            if complete_keys is not None:
+                new_rows = new_rows[new_rows[KEY_COLUMN].isin(complete_keys)]
+            # with their derived features, so cached graphs of those can be updated too
+            mark_data_changed(add_features(new_rows) if stats['appended_only'] else None)
+
+    def close(self):
+        pass
+
+class CSVBackend(Backend):
+    name = 'CSV'
+
+    def __init__(self, csv_path):
+        super().__init__(csv_path)
+        # chunk workers for big CSVs - threads, since a process pool would re-run the GUI script in each child
+        self.executor = None
+
+    def streaming(self):
+        return os.path.getsize(self.csv_path) > STREAM_BYTES
+
+    def stream_executor(self):
+        if self.executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.executor = ThreadPoolExecutor(max_workers=STREAM_WORKERS)
+        return self.executor
+
+    def columns(self):
+        # derived features are worked out into the columnar cache (or per chunk for big CSVs)
+        from titanic_features import derived_names
+        from titanic_startup import read_csv_header
+        columns = read_csv_header(self.csv_path)
+        return columns + derived_names(columns)
+
+    def load(self):
+        # builds (or checks) the columnar cache - too big to load whole, the header is enough
+        from titanic_data import load_column_names
+        if self.streaming():
+            return self.columns()
+        with self.writing():
+            return load_column_names(self.csv_path)
+
+    def cube_counts(self, selected_first_feature, selected_second_feature=None):
+        # from the cube file built with the columnar cache (rows appended to the CSV since are counted and added on)
+        from titanic_cube import covers, lookup_entries
+        from titanic_data import load_cube
+        if self.streaming() or not covers(selected_first_feature, selected_second_feature):
+            return None
+        cube = load_cube(self.csv_path)
+        features = [selected_first_feature] + ([selected_second_feature] if selected_second_feature else [])
+        if cube is None or any(feature not in cube['columns'] for feature in features):
+            return None
+        return lookup_entries(cube['entries'], selected_first_feature, selected_second_feature)
+
+    def aggregate(self, selected_graph_type, selected_first_feature, selected_second_feature, selected_bins, filters=(), sample=0):
+        # load the cleaned data for just the selected (and filtered on) columns, then aggregate it for plotting
+        # (memory mapped from the columnar cache, rebuilt only when the CSV changes) - or stream big CSVs in chunks
+        # unfiltered bar plots of the cube columns are looked up instead
+        from titanic_aggregate import aggregate_graph_data, bar_aggregates, sampled_aggregates, select_rows
+        from titanic_data import load_columns
+        from titanic_filters import filter_columns
+        if selected_graph_type == 'Bar Plot' and not filters and not sample:
+            with span('cube'):
+                counts = self.cube_counts(selected_first_feature, selected_second_feature)
+            if counts is not None:
+                return bar_aggregates('Bar Plot', selected_first_feature, selected_second_feature, counts)
+        if self.streaming():
+            from titanic_stream import stream_graph_data
+            with span('aggregate'):
+                return stream_graph_data({'kind': 'csv', 'path': self.csv_path}, selected_graph_type, selected_first_feature,
+                                         selected_second_feature, selected_bins, filters, sample, self.stream_executor())
+        columns = [selected_first_feature] + ([selected_second_feature] if selected_second_feature else [])
+        with span('get_data'):
+            cleaned_data = load_columns(self.csv_path, list(dict.fromkeys(columns + filter_columns(filters))), cleaned=True)
+        with span('aggregate'):
+            # boolean masks for the filters, random positions for the sample
+            selected_data, scale = select_rows(cleaned_data, filters, sample)
+            if scale is not None:
+                return sampled_aggregates(selected_graph_type, selected_first_feature, selected_second_feature, selected_data, selected_bins, scale)
+            return aggregate_graph_data(selected_graph_type, selected_first_feature, selected_second_feature, selected_data, selected_bins)
+
+    def row_estimate(self):
+        from titanic_data import load_columns
+        if self.streaming():
+            from titanic_stream import estimate_csv_rows
+            return estimate_csv_rows(self.csv_path)
+        return len(load_columns(self.csv_path, self.columns()[:1], cleaned=True))
+
+    def ping(self):
+        return os.path.exists(self.csv_path)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+class SQLiteBackend(Backend):
+    name = 'SQLite'
+
+    def __init__(self, path='titanic.db', table_name='titanic_data', csv_path='train.csv'):
+        super().__init__(csv_path)
+        self.path = os.path.abspath(path)
+        self.table_name = table_name
+        # one read-only connection per thread - readers never wait on each other or on the writer (WAL)
+        self.local = threading.local()
+        self.readers = []
+        # SQLite has a single writer anyway, so writes share one connection
+        self.writer = None
+        self.writer_lock = threading.Lock()
+
+    def reader(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            # mode=ro - a stray write from a reader fails instead of taking the write lock
+            # check_same_thread is off only so close() can close it, it's still used by one thread
+            conn = sqlite3.connect(f'file:{quote(self.path)}?mode=ro', uri=True, check_same_thread=False)
+            self.local.conn = conn
+            self.readers.append(conn)
+        return conn
+
+    @contextmanager
+    def writing(self):
+        from titanic_sqlite import tune_connection
+        with super().writing(), self.writer_lock:
+            if self.writer is None:
+                self.writer = sqlite3.connect(self.path, check_same_thread=False)
+                tune_connection(self.writer)
+            yield self.writer
+
+    def columns(self):
+        from titanic_features import derived_names
+        from titanic_sqlite import CLEAN_FLAG, get_table_columns
+        from titanic_startup import read_csv_header
+        columns = []
+        if os.path.exists(self.path):
+            columns = [column for column in get_table_columns(self.reader(), self.table_name) if column != CLEAN_FLAG]
+        # first run - the table is loaded in the background, take the names from the CSV header
+        columns = columns or read_csv_header(self.csv_path)
+        # derived features not stored yet are added by load()
+        return columns + derived_names(columns)
+
+    def load(self):
+        from titanic_sqlite import ingest_csv, needs_ingest
+        with self.writing() as conn:
+            # Check if table exists (or an earlier load was interrupted), if so stream it in from CSV
+            if needs_ingest(conn, self.table_name):
+                # Insert data into SQLite in batches, resuming from the last checkpoint
+                stats = ingest_csv(conn, self.csv_path, self.table_name)
+            else:
+                stats = None
+        if stats is not None:
+            return dict(stats, features=self.refresh_features(), cube=self.refresh_cube())
+        # already loaded - just pick up any rows added to the CSV since
+        return self.sync()
+
+    def sync(self):
+        from titanic_data import KEY_COLUMN
+        from titanic_sqlite import complete_keys, cube_fresh, fresh_features, store_cube, store_features, sync_csv
+        with self.writing() as conn:
+            # features that were up to date before the sync only need working out for the synced rows
+            fresh = fresh_features(conn, self.table_name)
+            cube = cube_fresh(conn, self.table_name)
+            stats = sync_csv(conn, self.csv_path, self.table_name)
+            if fresh:
+                store_features(conn, fresh, self.table_name, keys=stats['new_rows'][KEY_COLUMN])
+            # and the cube only needs their counts added on - after the features, they decide which rows are complete
+            if cube and stats['appended_only']:
+                store_cube(conn, self.table_name, keys=stats['new_rows'][KEY_COLUMN])
+            self.data_changed(stats, complete_keys(conn, stats['new_rows'][KEY_COLUMN], self.table_name))
+        return dict(stats, features=self.refresh_features(), cube=self.refresh_cube())
+
+    def refresh_features(self):
+        # derived features that are missing or stale, worked out for every row and stored
+        from titanic_data import mark_data_changed
+        from titanic_sqlite import stale_features, store_features
+        with self.writing() as conn:
+            names = stale_features(conn, self.table_name)
+            if names:
+                store_features(conn, names, self.table_name)
+                mark_data_changed()
+        return names
+
+    def refresh_cube(self):
+        # the cube worked out again from every cleaned row if it's missing or stale - None if it was up to date
+        from titanic_sqlite import cube_fresh, store_cube
+        with self.writing() as conn:
+            if cube_fresh(conn, self.table_name):
+                return None
+            return store_cube(conn, self.table_name)
+
+    def cube_counts(self, selected_first_feature, selected_second_feature=None):
+        from titanic_sqlite import cube_counts, get_table_columns
+        conn = self.reader()
+        return cube_counts(conn, get_table_columns(conn, self.table_name), selected_first_feature, selected_second_feature, self.table_name)
+
+    def aggregate(self, selected_graph_type, selected_first_feature, selected_second_feature, selected_bins, filters=(), sample=0):
+        # clean, filter and aggregate inside SQLite, only the grouped counts come back
+        from titanic_sqlite import aggregate_graph_data_sqlite
+        with span('query'):
+            return aggregate_graph_data_sqlite(self.reader(), selected_graph_type, selected_first_feature, selected_second_feature,
+                                               selected_bins, self.table_name, filters, sample)
+
+    def row_estimate(self):
+        from titanic_sqlite import row_estimate
+        return row_estimate(self.reader(), self.table_name)
+
+    def add_column(self, column_name, default_value=None):
+        # False if the column is already there
+        from titanic_data import mark_data_changed
+        from titanic_sqlite import add_column, get_table_columns, value_sql_type
+        with self.writing() as conn:
+            if column_name in get_table_columns(conn, self.table_name):
+                return False
+            # the column type follows the default value (INTEGER, REAL or TEXT)
+            add_column(conn, column_name, value_sql_type(default_value), default_value, self.table_name)
+            mark_data_changed()
+        # the new column counts towards which rows are complete
+        self.refresh_cube()
+        return True
+
+    def ping(self):
+        with self.writing() as conn:
+            conn.execute('SELECT 1')
+        return True
+
+    def close(self):
+        from titanic_sqlite import optimize
+        with self.writer_lock:
+            if self.writer is not None:
+                optimize(self.writer)
+                self.writer.close()
+                self.writer = None
+        for conn in self.readers:
+            conn.close()
+        self.readers = []
+        self.local = threading.local()
+
+class MongoBackend(Backend):
+    name = 'MongoDB'
+
+    def __init__(self, uri=None, db_name='Titanic-Data', collection_name='Titanic-V1', csv_path='train.csv'):
+        super().__init__(csv_path)
+        from pymongo import MongoClient
+        # MongoClient is thread safe and pools its own connections - one per backend is plenty
+        # it connects in the background, so this doesn't block
+        self.client = MongoClient(uri, maxPoolSize=MONGO_MAX_POOL_SIZE, minPoolSize=MONGO_MIN_POOL_SIZE,
+                                  serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                                  connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS, socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+                                  compressors=mongo_compressors(), retryReads=True, retryWrites=True)
+        self.db = self.client[db_name]
+        self.collection = self.db[collection_name]
+        # reads go straight through the client's pool, writes (loads, syncs, new columns) take turns
+        self.writer_lock = threading.Lock()
+
+    @contextmanager
+    def writing(self):
+        with super().writing(), self.writer_lock:
+            yield
+
+    def columns(self):
+        # one sampled document is enough, fall back to the CSV header if there isn't one yet
+        # derived features not stored yet are added by load()
+        from titanic_features import derived_names
+        from titanic_startup import read_csv_header
+        try:
+            columns = list(self.collection.find_one({}, {'_id': 0}) or read_csv_header(self.csv_path))
+        except Exception as e:
+            print(f'Failed to sample MongoDB: {e}')
+            columns = read_csv_header(self.csv_path)
+        return columns + derived_names(columns)
+
+    def load(self):
+        from titanic_mongo import load_csv, needs_load
+        # checked under the writer lock, so two loads at once can't both find it empty and both load it
+        with self.writing():
+            # If no object (JSON) data exists in collection, or the first load was interrupted part way
+            if needs_load(self.collection):
+                # Stream the CSV into MongoDB in parallel insert_many batches, resuming from the last checkpoint
+                stats = load_csv(self.collection, self.csv_path)
+            else:
+                stats = None
+        if stats is not None:
+            return dict(stats, features=self.refresh_features(), cube=self.refresh_cube())
+        # already loaded - just pick up any rows added to the CSV since
+        return self.sync()
+
+    def sync(self):
+        from titanic_data import KEY_COLUMN
+        from titanic_mongo import complete_keys, cube_fresh, fresh_features, store_cube, store_features, sync_csv
+        with self.writing():
+            # features that were up to date before the sync only need working out for the synced documents
+            fresh = fresh_features(self.collection)
+            cube = cube_fresh(self.collection)
+            stats = sync_csv(self.collection, self.csv_path)
+            if fresh:
+                store_features(self.collection, fresh, keys=stats['new_rows'][KEY_COLUMN])
+            # and the cube only needs their counts added on - after the features, they decide which documents are complete
+            if cube and stats['appended_only']:
+                store_cube(self.collection, keys=stats['new_rows'][KEY_COLUMN])
+            self.data_changed(stats, complete_keys(self.collection, stats['new_rows'][KEY_COLUMN]))
+        return dict(stats, features=self.refresh_features(), cube=self.refresh_cube())
+
+    def refresh_features(self):
+        # derived features that are missing or stale, worked out for every document and stored
+        from titanic_data import mark_data_changed
+        from titanic_mongo import stale_features, store_features
+        with self.writing():
+            names = stale_features(self.collection)
+            if names:
+                store_features(self.collection, names)
+                mark_data_changed()
+        return names
+
+    def refresh_cube(self):
+        # the cube worked out again from every cleaned document if it's missing or stale - None if it was up to date
+        from titanic_mongo import cube_fresh, store_cube
+        with self.writing():
+            if cube_fresh(self.collection):
+                return None
+            return store_cube(self.collection)
+
+    def cube_counts(self, selected_first_feature, selected_second_feature=None):
+        from titanic_mongo import cube_counts, get_collection_columns
+        return cube_counts(self.collection, get_collection_columns(self.collection), selected_first_feature, selected_second_feature)
+
+    def aggregate(self, selected_graph_type, selected_first_feature, selected_second_feature, selected_bins, filters=(), sample=0):
+        # clean, filter and aggregate inside MongoDB, only the grouped buckets come back
+        from titanic_mongo import aggregate_graph_data_mongo
+        with span('query'):
+            return aggregate_graph_data_mongo(self.collection, selected_graph_type, selected_first_feature, selected_second_feature,
+                                              selected_bins, filters, sample)
+
+    def row_estimate(self):
+        # from the collection metadata, no scan
+        return self.collection.estimated_document_count()
+
+    def add_column(self, column_name, default_value=None):
+        # False if the field is already there
+        from titanic_data import mark_data_changed
+        with self.writing():
+            if self.collection.find_one({column_name: {'$exists': True}}) is not None:
+                return False
+            self.collection.update_many({}, {'$set': {column_name: default_value}})
+            mark_data_changed()
+        # the new field counts towards which documents are complete
+        self.refresh_cube()
+        return True
+
+    def ping(self):
+        self.client.server_info()
+        return True
+
+    def close(self):
+        self.client.close()
+
+class MemoryBackend(Backend):
+    # the whole table (with its derived features) held in one frame, and its cleaned copy in clean_data's memo -
+    # for the shared server, where one copy serves every client. Synced rows are upserted into both (apply_new_rows)
+    name = 'memory'
+
+    def __init__(self, csv_path='train.csv'):
+        super().__init__(csv_path)
+        self.data = None
+        # how far into the CSV the frame is up to, and the defaults of added columns (for rows synced later)
+        self.offset = 0
+        self.defaults = {}
+
+    def columns(self):
+        from titanic_features import derived_names
+        from titanic_startup import read_csv_header
+        if self.data is not None:
+            return list(self.data.columns)
+        columns = read_csv_header(self.csv_path)
+        return columns + derived_names(columns)
+
+    def load(self):
+        # the table from the columnar cache (built first if need be), then cleaned once
+        import time
+        from titanic_data import clean_data, csv_end_offset, load_columns
+        if self.data is not None:
+            return self.sync()
+        start = time.perf_counter()
+        with self.writing():
+            # a half written last line is read now and again by the next sync - it's upserted, so that's harmless
+            offset = csv_end_offset(self.csv_path)
+            data = load_columns(self.csv_path)
+            clean_data(data)
+            self.data, self.offset = data, offset
+        seconds = time.perf_counter() - start
+        return {'rows': len(data), 'seconds': seconds, 'rows_per_second': len(data) / seconds if seconds else 0.0}
+
+    def sync(self):
+        # rows appended to the CSV since, with their derived features, upserted on the passenger id
+        import time
+        from titanic_data import KEY_COLUMN, apply_new_rows, read_csv_since
+        from titanic_features import add_features
+        if os.path.getsize(self.csv_path) < self.offset:
+            # the file was rewritten shorter - start again
+            self.data = None
+            return self.load()
+        start = time.perf_counter()
+        with self.writing():
+            new_rows, offset = read_csv_since(self.csv_path, self.offset)
+            appended_only = True
+            if len(new_rows):
+                new_rows = add_features(new_rows.assign(**self.defaults))
+                appended_only = not self.data[KEY_COLUMN].isin(new_rows[KEY_COLUMN]).any()
+                # also moves the data version on (and hands count tables in the render cache the new rows)
+                self.data = apply_new_rows(self.data, new_rows)
+            self.offset = offset
+        return {'rows': len(new_rows), 'new_rows': new_rows, 'appended_only': appended_only, 'seconds': time.perf_counter() - start}
+
+    def aggregate(self, selected_graph_type, selected_first_feature, selected_second_feature, selected_bins, filters=(), sample=0):
+        from titanic_aggregate import aggregate_graph_data, sampled_aggregates, select_rows
+        from titanic_data import clean_data
+        with span('get_data'):
+            # the memo hands back the same cleaned frame until the data changes
+            cleaned_data = clean_data(self.data)
+        with span('aggregate'):
+            selected_data, scale = select_rows(cleaned_data, filters, sample)
+            if scale is not None:
+                return sampled_aggregates(selected_graph_type, selected_first_feature, selected_second_feature, selected_data, selected_bins, scale)
+            return aggregate_graph_data(selected_graph_type, selected_first_feature, selected_second_feature, selected_data, selected_bins)
+
+    def row_estimate(self):
+        return len(self.data) if self.data is not None else 0
+
+    def add_column(self, column_name, default_value=None):
+        from titanic_data import mark_data_changed
+        with self.writing():
+            if column_name in self.data.columns:
+                return False
+            self.data = self.data.assign(**{column_name: default_value})
+            self.defaults[column_name] = default_value
+            mark_data_changed()
+        return True
+
+    def ping(self):
+        return self.data is not None
+
+class ServerBackend(Backend):
+    # thin client of a titanic_server - the server holds the data and the render cache and does the work,
+    # this process only sends the selections and draws what comes back
+    # nothing is kept in the local render cache, it would go stale when another client syncs the server
+    name = 'server'
+
+    def __init__(self, address=DEFAULT_SERVER, csv_path='train.csv', timeout=SERVER_TIMEOUT):
+        super().__init__(csv_path)
+        self.address = address
+        self.timeout = timeout
+        # one kept-alive connection per thread
+        self.local = threading.local()
+        self.connections = []
+        self.connections_lock = threading.Lock()
+
+    def connection(self):
+        from urllib.parse import urlsplit
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            if self.address.startswith('unix:'):
+                conn = UnixHTTPConnection(self.address[len('unix:'):], self.timeout)
+            else:
+                url = urlsplit(self.address)
+                conn = http.client.HTTPConnection(url.hostname, url.port, timeout=self.timeout)
+            self.local.conn = conn
+            with self.connections_lock:
+                self.connections.append(conn)
+        return conn
+
+    def request(self, method, path, params=None, body=None):
+        # JSON in and out - the server's 4xx errors (unknown columns, bad filters) come back as ValueErrors
+        import json
+        from urllib.parse import urlencode
+        if params:
+            path += '?' + urlencode(params)
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {'Content-Type': 'application/json'} if payload is not None else {}
+        for attempt in range(2):
+            conn = self.connection()
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # the server closed the kept-alive connection - one more go on a fresh one
+                conn.close()
+                self.local.conn = None
+                if attempt:
+                    raise
+        result = json.loads(data) if data else None
+        if response.status >= 400:
+            message = result.get('error') if isinstance(result, dict) else response.reason
+            if response.status < 500:
+                raise ValueError(message)
+            raise RuntimeError(f'Server error: {message}')
+        return result
+
+    def graph_params(self, selected_graph_type, selected_first_feature, selected_second_feature, selected_bins, filters=(), sample=0):
+        import json
+        return {'type': selected_graph_type, 'first': selected_first_feature, 'second': selected_second_feature or '',
+                'bins': selected_bins, 'filters': json.dumps([list(condition) for condition in filters]), 'sample': sample}
+
+    def columns(self):
+        from titanic_features import derived_names
+        from titanic_startup import read_csv_header
+        try:
+            return self.request('GET', '/columns')
+        except OSError as e:
+            # server not up yet - the CSV header will do for the dropdowns
+            print(f'Failed to reach the server: {e}')
+            columns = read_csv_header(self.csv_path)
+            return columns + derived_names(columns)
+
+    def load(self):
+        # the server loaded the data when it started - just have it pick up anything appended since
+        return self.sync()
+
+    def sync(self):
+        # the synced rows stay on the server
+        return dict(self.request('POST', '/sync'), new_rows=None)
+
+    def aggregate(self, selected_graph_type, selected_first_feature, selected_second_feature, selected_bins, filters=(), sample=0):
+        from titanic_aggregate import aggregates_from_json
+        with span('query'):
+            params = self.graph_params(selected_graph_type, selected_first_feature, selected_second_feature, selected_bins, filters, sample)
+            return aggregates_from_json(self.request('GET', '/aggregate', params))
+
+    def render(self, cache_key, selected_graph_type, selected_first_feature, selected_second_feature, selected_bins, filters=(), sample=0):
+        # the server caches it
+        from titanic_aggregate import aggregated_rows
+        aggregates = self.aggregate(selected_graph_type, selected_first_feature, selected_second_feature, selected_bins, filters, sample)
+        note(rows=aggregated_rows(aggregates))
+        return aggregates
+
+    def preview(self, selected_graph_type, selected_first_feature, selected_second_feature, selected_bins, filters=()):
+        from titanic_aggregate import aggregated_rows, aggregates_from_json
+        with span('query'):
+            params = self.graph_params(selected_graph_type, selected_first_feature, selected_second_feature, selected_bins, filters)
+            aggregates = self.request('GET', '/preview', params)
+        if aggregates is None:
+            return None
+        aggregates = aggregates_from_json(aggregates)
+        note(rows=aggregated_rows(aggregates))
+        return aggregates
+
+    def row_estimate(self):
+        return self.request('GET', '/stats')['rows']
+
+    def add_column(self, column_name, default_value=None):
+        return self.request('POST', '/add_column', body={'name': column_name, 'default': default_value})['added']
+
+    def ping(self):
+        self.request('GET', '/stats')
+        return True
+
+    def close(self):
+        with self.connections_lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections = []
+        self.local = threading.local()
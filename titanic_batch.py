@@ -0,0 +1,166 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+from matplotlib.figure import Figure
+import seaborn as sb
+from titanic_data import load_column_names, load_columns
+from titanic_aggregate import aggregate_graph_data
+from titanic_graph import draw_graph
+
+# headless batch renderer - draws a list of plot specs across a process pool
+# and writes each one to an image file, no windows and no plt.show()
+#
+# a spec is a plain dict so it can be sent to the worker processes:
+#   name              - file name for the output image
+#   kind              - a seaborn axes function ('countplot', 'scatterplot', ...), 'hist',
+#                       'facet_hist' (one histogram per value of 'col') or 'graph' (same as the GUIs)
+#   options           - keyword arguments for the plotting function
+#   xlabel/ylabel/title/legend - optional labels
+#   figsize           - optional figure size in inches
+# 'graph' specs take graph_type, first_feature, second_feature, palette and bins like create_graph
+
+# the plots from titanic.py
+TITANIC_PLOTS = [
+    # example 1 - simple bar plot of survival counts
+    {'name': 'survival_counts', 'kind': 'countplot', 'options': {'x': 'Survived'}},
+    # example 2 - bar plot for passenger class counts
+    {'name': 'class_counts', 'kind': 'countplot', 'options': {'x': 'Pclass', 'hue': 'Pclass', 'palette': 'viridis', 'legend': False},
+     'xlabel': 'Passenger Class', 'ylabel': 'Count', 'title': 'Passenger Class Counts'},
+    # example 3 - histogram for passenger ages
+    {'name': 'age_histogram', 'kind': 'hist', 'x': 'Age', 'options': {'bins': 30, 'color': 'skyblue', 'edgecolor': 'black'},
+     'xlabel': 'Age', 'ylabel': 'Frequency', 'title': 'Histogram for Passenger Ages'},
+    # example 4 - scatter plot of fares vs ages
+    {'name': 'fare_vs_age', 'kind': 'scatterplot',
+     'options': {'x': 'Age', 'y': 'Fare', 'hue': 'Survived', 'palette': 'coolwarm', 'alpha': 0.7},
+     'xlabel': 'Age', 'ylabel': 'Fare', 'title': 'Scatter Plot of Fares vs Ages', 'legend': {'title': 'Survived', 'loc': 'upper right'}},
+    # example 5 - box plot of fare distibution by passenger class
+    {'name': 'fare_by_class', 'kind': 'boxplot', 'options': {'x': 'Pclass', 'y': 'Fare', 'hue': 'Pclass', 'palette': 'Set2', 'legend': False},
+     'xlabel': 'Passenger Class', 'ylabel': 'Fare', 'title': 'Box Plot of Fare Distribution by Passenger Class'},
+    # historgram for our 'FamilySize' feature - 'integers' means one bin per family size
+    {'name': 'family_size_histogram', 'kind': 'hist', 'x': 'FamilySize', 'options': {'bins': 'integers', 'edgecolor': 'black'},
+     'xlabel': 'Family Size', 'ylabel': 'Count', 'title': 'Distribution of Family Sizes'},
+    # bar plot for our 'FamilySize' feature
+    {'name': 'survival_by_family_size', 'kind': 'barplot', 'options': {'x': 'FamilySize', 'y': 'Survived', 'errorbar': None},
+     'xlabel': 'Family Size', 'ylabel': 'Survival Rate', 'title': 'Survival Rate by Family Size'},
+    # faceted histogram of ages, one per passenger class
+    {'name': 'age_by_class', 'kind': 'facet_hist', 'x': 'Age', 'col': 'Pclass', 'col_template': '{col_name} class',
+     'options': {'bins': 20, 'color': 'skyblue'}, 'xlabel': 'Age', 'ylabel': 'Count', 'figsize': (12, 4)},
+]
+
+# cleaned data for the worker process, loaded once when the worker starts
+_report_data = None
+
+def load_report_data(csv_path):
+    # cleaned table from the memory mapped columnar cache
+    # (workers all map the same file, so the data isn't pickled per plot or per worker)
+    # it already has the derived features - 'FamilySize' is 'SibSp' + 'Parch' (titanic_features)
+    return load_columns(csv_path, cleaned=True)
+
+def graph_spec(graph_type, first_feature, second_feature='', palette='deep', bins=0, name=None):
+    # a spec for any create_graph combination from the GUIs
+    if name is None:
+        name = '_'.join(part for part in [graph_type.replace(' ', '_').lower(), first_feature, second_feature] if part)
+    return {'name': name, 'kind': 'graph', 'graph_type': graph_type, 'first_feature': first_feature,
+            'second_feature': second_feature, 'palette': palette, 'bins': bins, 'figsize': (8, 6)}
+
+def set_labels(ax, spec):
+    if 'xlabel' in spec:
+        ax.set_xlabel(spec['xlabel'])
+    if 'ylabel' in spec:
+        ax.set_ylabel(spec['ylabel'])
+    if 'title' in spec:
+        ax.set_title(spec['title'])
+    if 'legend' in spec:
+        ax.legend(**spec['legend'])
+
+def draw_spec(spec, data, figure):
+    kind = spec['kind']
+    options = dict(spec.get('options', {}))
+
+    if kind == 'facet_hist':
+        values = sorted(data[spec['col']].dropna().unique())
+        axes = figure.subplots(1, len(values), sharex=True, sharey=True, squeeze=False)[0]
+        for ax, value in zip(axes, values):
+            ax.hist(data.loc[data[spec['col']] == value, spec['x']].dropna(), **options)
+            ax.set_title(spec['col_template'].format(col_name=value))
+            ax.set_xlabel(spec.get('xlabel', spec['x']))
+        axes[0].set_ylabel(spec.get('ylabel', 'Count'))
+        return figure
+
+    ax = figure.add_subplot()
+    if kind == 'graph':
+        aggregates = aggregate_graph_data(spec['graph_type'], spec['first_feature'], spec.get('second_feature'), data, spec.get('bins', 0))
+        draw_graph(aggregates, spec.get('palette', 'deep'), ax=ax)
+    elif kind == 'hist':
+        values = data[spec['x']].dropna()
+        if options.get('bins') == 'integers':
+            options['bins'] = range(1, int(values.max()) + 2)
+        ax.hist(values, **options)
+    else:
+        getattr(sb, kind)(data=data, ax=ax, **options)
+    set_labels(ax, spec)
+    return figure
+
+def init_worker(csv_path):
+    global _report_data
+    matplotlib.use('Agg')
+    _report_data = load_report_data(csv_path)
+
+def render_spec(spec, out_dir, formats):
+    # runs in a worker process
+    start = time.perf_counter()
+    figure = Figure(figsize=spec.get('figsize'))
+    draw_spec(spec, _report_data, figure)
+    paths = []
+    for image_format in formats:
+        path = os.path.join(out_dir, f"{spec['name']}.{image_format}")
+        figure.savefig(path, format=image_format)
+        paths.append(path)
+    return spec['name'], paths, time.perf_counter() - start
+
+def print_report(results, total_seconds):
+    for name, paths, seconds in results:
+        print(f'{seconds * 1000:8.1f} ms  {name}  ({", ".join(paths)})')
+    print(f'{total_seconds * 1000:8.1f} ms  total for {len(results)} plots')
+
+def run_batch(specs, csv_path='train.csv', out_dir='reports', formats=('png',), workers=None, report=print_report):
+    os.makedirs(out_dir, exist_ok=True)
+    # build/check the columnar cache once here, so the workers don't all race to build it
+    load_column_names(csv_path)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(csv_path,)) as executor:
+        futures = [executor.submit(render_spec, spec, out_dir, tuple(formats)) for spec in specs]
+        results = [future.result() for future in futures]
+    if report is not None:
+        report(results, time.perf_counter() - start)
+    return results
+
+def parse_graph(text):
+    # 'graph type,first feature[,second feature[,palette[,bins]]]'
+    parts = text.split(',')
+    graph_type, first_feature = parts[0], parts[1]
+    second_feature = parts[2] if len(parts) > 2 else ''
+    palette = parts[3] if len(parts) > 3 and parts[3] else 'deep'
+    bins = int(parts[4]) if len(parts) > 4 else 0
+    return graph_spec(graph_type, first_feature, second_feature, palette, bins)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render the Titanic plots to image files')
+    parser.add_argument('--csv', default='train.csv')
+    parser.add_argument('--out', default='reports', help='directory to write the images to')
+    parser.add_argument('--format', action='append', choices=['png', 'svg'], help='image format (repeat for both)')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--graph', action='append', default=[],
+                        help="extra GUI graph: 'graph type,first feature[,second feature[,palette[,bins]]]'")
+    parser.add_argument('--only-graphs', action='store_true', help="skip the titanic.py plots")
+    args = parser.parse_args(argv)
+
+    specs = [] if args.only_graphs else list(TITANIC_PLOTS)
+    specs += [parse_graph(text) for text in args.graph]
+    return run_batch(specs, args.csv, args.out, args.format or ['png'], args.workers)
+
+if __name__ == '__main__':
+    main()
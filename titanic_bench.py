@@ -0,0 +1,286 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import closing
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import numpy as np
+import pandas as pd
+from titanic_aggregate import aggregate_graph_data
+from titanic_data import build_columnar_cache, clean_frame, columnar_cache_paths, have_pyarrow, optimize_dtypes
+from titanic_graph import draw_graph
+
+# benchmark harness - times every stage from CSV to pixels for the CSV, SQLite and MongoDB variants
+# on synthetic passenger tables, headless, and writes the results as JSON so runs can be compared
+#
+#   python titanic_bench.py --sizes 1e3,1e5,1e6 --out bench.json
+#   python titanic_bench.py --compare bench.json --out bench_new.json    (flags stages that got slower)
+
+DEFAULT_SIZES = [10 ** 3, 10 ** 4, 10 ** 5]
+DEFAULT_GRAPHS = ['Bar Plot,Pclass,Survived', 'Histogram,Age']
+VARIANTS = ['csv', 'sqlite', 'mongo']
+
+# rows generated (and written) at a time, so 10^8 row tables don't have to fit in memory
+SYNTHETIC_CHUNK_SIZE = 1000000
+
+# a stage this much slower than the old run counts as a regression
+REGRESSION_RATIO = 1.2
+# ... as long as it's also at least this many seconds slower - below that it's timer noise
+REGRESSION_MIN_SECONDS = 0.05
+
+def write_synthetic_csv(path, rows, template_path='train.csv', seed=0, chunk_size=SYNTHETIC_CHUNK_SIZE):
+    # passengers resampled (with replacement) from train.csv, so every column keeps its real
+    # distribution and missing values - only the PassengerIds are new
+    template = pd.read_csv(template_path)
+    rng = np.random.default_rng(seed)
+    with open(path, 'w', newline='') as f:
+        for start in range(0, rows, chunk_size):
+            count = min(chunk_size, rows - start)
+            chunk = template.iloc[rng.integers(0, len(template), count)].reset_index(drop=True)
+            chunk['PassengerId'] = np.arange(start + 1, start + count + 1)
+            chunk.to_csv(f, header=start == 0, index=False)
+
+def peak_rss():
+    # the process's high-water mark (ru_maxrss is KB on Linux, bytes on macOS)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+class StageTimer:
+    # runs stages, recording seconds and peak memory for each
+    # tracemalloc sees numpy/pandas buffers but slows Python-heavy stages down - turn it off for pure timings
+    def __init__(self, memory=True):
+        self.memory = memory
+        self.stages = []
+
+    def run(self, stage, work, **details):
+        if self.memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            result = work()
+        finally:
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if self.memory else None
+            if self.memory:
+                tracemalloc.stop()
+        self.stages.append(dict({'stage': stage, 'seconds': seconds, 'peak_bytes': peak, 'rss_bytes': peak_rss()}, **details))
+        return result
+
+def parse_graph(text):
+    # 'graph type,first feature[,second feature[,bins]]'
+    parts = text.split(',')
+    return {'graph_type': parts[0], 'first_feature': parts[1],
+            'second_feature': parts[2] if len(parts) > 2 else '', 'bins': int(parts[3]) if len(parts) > 3 else 0}
+
+def graph_label(graph):
+    return ' '.join(part for part in [graph['graph_type'], graph['first_feature'], graph['second_feature']] if part)
+
+def time_graphs(timer, cleaned_data, graphs):
+    # create_graph (aggregate + draw onto the axes) and the canvas draw, per graph
+    for graph in graphs:
+        label = graph_label(graph)
+        figure = Figure(figsize=(8, 6))
+        canvas = FigureCanvasAgg(figure)
+
+        def create():
+            aggregates = aggregate_graph_data(graph['graph_type'], graph['first_feature'], graph['second_feature'], cleaned_data, graph['bins'])
+            draw_graph(aggregates, 'deep', ax=figure.add_subplot())
+        timer.run('create_graph', create, graph=label)
+        timer.run('canvas_draw', canvas.draw, graph=label)
+
+def time_pushdown(timer, aggregate, graphs):
+    # what the database GUIs actually do - aggregate inside the database, draw the summary
+    for graph in graphs:
+        label = graph_label(graph)
+        figure = Figure(figsize=(8, 6))
+        canvas = FigureCanvasAgg(figure)
+        aggregates = timer.run('db_aggregate', lambda: aggregate(graph), graph=label)
+        timer.run('draw_aggregates', lambda: draw_graph(aggregates, 'deep', ax=figure.add_subplot()), graph=label)
+        timer.run('canvas_draw', canvas.draw, graph=label, path='pushdown')
+
+def bench_csv(timer, csv_path, graphs, work_dir):
+    data = timer.run('read_csv', lambda: pd.read_csv(csv_path))
+    cleaned_data = timer.run('clean_data', lambda: clean_frame(data), rows=len(data))
+    del data
+    time_graphs(timer, cleaned_data, graphs)
+    if have_pyarrow():
+        from pyarrow import feather
+        # the CSV GUI's path - columnar cache built once, then memory mapped per graph
+        # (kept in the scratch directory, away from the real cache)
+        cache_dir = os.path.join(work_dir, 'cache')
+        timer.run('columnar_cache', lambda: build_columnar_cache(csv_path, cache_dir))
+        feather_path = columnar_cache_paths(csv_path, True, cache_dir)[0]
+        timer.run('load_columns', lambda: feather.read_table(feather_path, memory_map=True).to_pandas())
+
+def bench_sqlite(timer, csv_path, graphs, work_dir):
+    from titanic_sqlite import aggregate_graph_data_sqlite, ingest_csv
+    data = timer.run('read_csv', lambda: pd.read_csv(csv_path))
+    del data
+    with closing(sqlite3.connect(os.path.join(work_dir, 'bench.db'))) as conn:
+        timer.run('to_sql', lambda: ingest_csv(conn, csv_path, progress=None))
+        # the whole table back into a compact frame - what the GUI did before aggregating inside SQLite
+        data = timer.run('get_data', lambda: optimize_dtypes(pd.read_sql_query('SELECT * FROM titanic_data', conn), report=None))
+        cleaned_data = timer.run('clean_data', lambda: clean_frame(data.drop(columns='complete_row', errors='ignore')), rows=len(data))
+        del data
+        time_graphs(timer, cleaned_data, graphs)
+        del cleaned_data
+        time_pushdown(timer, lambda graph: aggregate_graph_data_sqlite(
+            conn, graph['graph_type'], graph['first_feature'], graph['second_feature'], graph['bins']), graphs)
+
+def bench_mongo(timer, csv_path, graphs, mongo_uri):
+    from pymongo import MongoClient
+    from titanic_mongo import aggregate_graph_data_mongo, load_csv
+    client = MongoClient(mongo_uri, serverSelectionTimeoutMS=3000)
+    client.server_info()
+    collection = client['titanic_bench']['passengers']
+    collection.drop()
+    try:
+        data = timer.run('read_csv', lambda: pd.read_csv(csv_path))
+        del data
+        timer.run('insert_many', lambda: load_csv(collection, csv_path, progress=None))
+        # the whole collection back into a compact frame - what the GUI did before aggregating inside MongoDB
+        data = timer.run('get_data', lambda: optimize_dtypes(pd.DataFrame(list(collection.find({}, {'_id': 0}))), report=None))
+        cleaned_data = timer.run('clean_data', lambda: clean_frame(data), rows=len(data))
+        del data
+        time_graphs(timer, cleaned_data, graphs)
+        del cleaned_data
+        time_pushdown(timer, lambda graph: aggregate_graph_data_mongo(
+            collection, graph['graph_type'], graph['first_feature'], graph['second_feature'], graph['bins']), graphs)
+    finally:
+        client.drop_database('titanic_bench')
+        client.close()
+
+def run_variant(variant, rows, csv_path, graphs, work_dir, mongo_uri=None, memory=True):
+    timer = StageTimer(memory)
+    result = {'variant': variant, 'rows': rows}
+    try:
+        if variant == 'csv':
+            bench_csv(timer, csv_path, graphs, work_dir)
+        elif variant == 'sqlite':
+            bench_sqlite(timer, csv_path, graphs, work_dir)
+        elif variant == 'mongo':
+            if not mongo_uri:
+                raise RuntimeError('no --mongo-uri given')
+            bench_mongo(timer, csv_path, graphs, mongo_uri)
+    except Exception as e:
+        # e.g. no MongoDB server, or out of memory at 10^8 rows - keep the stages that did finish
+        result['error'] = f'{type(e).__name__}: {e}'
+    result['stages'] = timer.stages
+    return result
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'matplotlib': matplotlib.__version__,
+        'sqlite': sqlite3.sqlite_version,
+    }
+
+def print_result(result):
+    title = f"{result['variant']} - {result['rows']} rows"
+    print(title)
+    for stage in result['stages']:
+        memory = f"{stage['peak_bytes'] / 1024 ** 2:9.1f} MB" if stage['peak_bytes'] is not None else ''
+        label = ' '.join(str(stage[key]) for key in ('graph', 'path') if key in stage)
+        print(f"  {stage['seconds'] * 1000:10.1f} ms {memory}  {stage['stage']} {label}")
+    if 'error' in result:
+        print(f"  stopped: {result['error']}")
+
+def run_benchmarks(sizes=DEFAULT_SIZES, variants=VARIANTS, graphs=None, template_path='train.csv',
+                   mongo_uri=None, memory=True, seed=0, report=print_result):
+    graphs = [parse_graph(text) for text in (graphs or DEFAULT_GRAPHS)]
+    results = []
+    work_dir = tempfile.mkdtemp(prefix='titanic_bench_')
+    try:
+        for rows in sizes:
+            csv_path = os.path.join(work_dir, f'passengers_{rows}.csv')
+            write_synthetic_csv(csv_path, rows, template_path, seed)
+            for variant in variants:
+                result = run_variant(variant, rows, csv_path, graphs, work_dir, mongo_uri, memory)
+                results.append(result)
+                if report is not None:
+                    report(result)
+                # each variant starts from an empty database
+                for name in os.listdir(work_dir):
+                    if name.startswith('bench.db'):
+                        os.remove(os.path.join(work_dir, name))
+            os.remove(csv_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {'environment': environment(), 'results': results}
+
+def stage_key(result, stage):
+    return (result['variant'], result['rows'], stage['stage'], stage.get('graph'), stage.get('path'))
+
+def compare_runs(old, new, ratio=REGRESSION_RATIO, min_seconds=REGRESSION_MIN_SECONDS):
+    # stages that are more than ratio times (and min_seconds) slower than the old run - (key, old seconds, new seconds)
+    old_seconds = {stage_key(result, stage): stage['seconds'] for result in old['results'] for stage in result['stages']}
+    regressions = []
+    for result in new['results']:
+        for stage in result['stages']:
+            key = stage_key(result, stage)
+            if key in old_seconds and stage['seconds'] > max(old_seconds[key] * ratio, old_seconds[key] + min_seconds):
+                regressions.append((key, old_seconds[key], stage['seconds']))
+    return regressions
+
+def parse_size(text):
+    # '1e6', '1000000' or '10^6'
+    if '^' in text:
+        base, power = text.split('^')
+        return int(base) ** int(power)
+    return int(float(text))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Titanic plots from CSV to pixels')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help='comma separated row counts, e.g. 1e3,1e4,10^6')
+    parser.add_argument('--variant', action='append', choices=VARIANTS, help='variant to run (repeat for more, default all)')
+    parser.add_argument('--graph', action='append', help="graph to time: 'graph type,first feature[,second feature[,bins]]'")
+    parser.add_argument('--csv', default='train.csv', help='template the synthetic passengers are drawn from')
+    parser.add_argument('--mongo-uri', default=os.getenv('DATABASE_URL'), help='MongoDB to benchmark against (uses a scratch database)')
+    parser.add_argument('--no-memory', action='store_true', help="don't trace memory (faster, cleaner timings)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='earlier JSON results to check for regressions')
+    parser.add_argument('--min-delta-ms', type=float, default=REGRESSION_MIN_SECONDS * 1000,
+                        help='ignore stages that got slower by less than this (timer noise)')
+    args = parser.parse_args(argv)
+
+    sizes = [parse_size(text) for text in args.sizes.split(',')]
+    run = run_benchmarks(sizes, args.variant or VARIANTS, args.graph, args.csv, args.mongo_uri, not args.no_memory, args.seed)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(run, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_runs(json.load(f), run, min_seconds=args.min_delta_ms / 1000)
+        for (variant, rows, stage, graph, path), old_seconds, new_seconds in regressions:
+            label = ' '.join(part for part in [stage, graph, path] if part)
+            print(f'SLOWER  {variant} {rows} rows  {label}: {old_seconds * 1000:.1f} ms -> {new_seconds * 1000:.1f} ms')
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,59 @@
+import time
+import tkinter as tk
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from titanic_graph import draw_graph
+from titanic_trace import current_trace, span
+
+# one figure + Tk canvas kept alive for the whole session
+# each render clears the axes and redraws into them instead of building new widgets
+# the Figure isn't created through pyplot, so pyplot never holds on to old figures
+
+class GraphCanvas:
+    def __init__(self, master, figsize=(8, 6)):
+        self.master = master
+        self.figsize = figsize
+        self.figure = None
+        self.ax = None
+        self.canvas = None
+        # what's on screen now, so a repeat of the same graph can skip the redraw
+        self.shown = None
+        # (trace, time the redraw was asked for) until the canvas has actually drawn
+        self.pending_trace = None
+
+    def create(self):
+        # built on first use so the window stays small until there's a graph to show
+        self.figure = Figure(figsize=self.figsize)
+        self.ax = self.figure.add_subplot()
+        self.canvas = FigureCanvasTkAgg(self.figure, master=self.master)
+        self.canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=1)
+        # fired once the figure has been rendered - the end of the render's trace
+        self.canvas.mpl_connect('draw_event', self.drawn)
+
+    def show(self, aggregates, selected_colour_palette):
+        trace = current_trace()
+        if self.canvas is None:
+            self.create()
+        elif self.shown is not None and self.shown[0] is aggregates and self.shown[1] == selected_colour_palette:
+            if trace is not None:
+                trace.finish()
+            return
+
+        with span('create_graph'):
+            # clear() drops the old bars, lines, legend and title but keeps the axes object
+            self.ax.clear()
+            draw_graph(aggregates, selected_colour_palette, ax=self.ax)
+        self.shown = (aggregates, selected_colour_palette)
+        # a redraw that never happened (superseded by this one) still ends its trace
+        self.drawn()
+        self.pending_trace = (trace, time.perf_counter()) if trace is not None else None
+        # draw_idle coalesces with any redraw Tk already has pending
+        self.canvas.draw_idle()
+
+    def drawn(self, event=None):
+        if self.pending_trace is None:
+            return
+        (trace, start), self.pending_trace = self.pending_trace, None
+        if event is not None:
+            trace.add('canvas_draw', start, time.perf_counter() - start)
+        trace.finish()
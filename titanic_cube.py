@@ -0,0 +1,90 @@
+import pandas as pd
+from titanic_features import features_signature
+
+# materialized data cube - every one- and two-way count table of the low-cardinality columns,
+# worked out when the data is loaded and kept up to date as rows arrive, so an unfiltered
+# bar plot of any of them (or any pair) is a lookup instead of a scan
+# counts are over the cleaned rows, the same ones the graphs are drawn from, and each store keeps its own:
+#   CSV      - a JSON file next to the columnar cache (titanic_data)
+#   SQLite   - a cube_counts table (titanic_sqlite)
+#   MongoDB  - a cube_counts collection (titanic_mongo)
+# tables are rolled up from the base cells (a count per combination of all the cube columns, one grouped pass),
+# and rows arriving later add the tables of just those rows on - counts are additive
+# a stored table is an entry per value (pair): (first feature, second feature, first value, second value, count)
+# with '' for the second feature/value of one-way tables, and each pair stored once, in CUBE_COLUMNS order
+
+# low-cardinality columns the cube covers
+CUBE_COLUMNS = ['Survived', 'Pclass', 'Sex', 'SibSp', 'Parch', 'Embarked']
+# bump it when the way the cube is worked out changes, so stored cubes are rebuilt
+CUBE_VERSION = 1
+
+def cube_columns(columns):
+    return [column for column in CUBE_COLUMNS if column in columns]
+
+def cube_signature(columns):
+    # what the stored counts depend on - every column the clean step checks decides which rows count,
+    # and derived features are columns too
+    return f"{CUBE_VERSION}:{','.join(sorted(columns))}:{features_signature()}"
+
+def covers(first_feature, second_feature=None):
+    if first_feature not in CUBE_COLUMNS:
+        return False
+    return not second_feature or (second_feature in CUBE_COLUMNS and second_feature != first_feature)
+
+def cube_key(first_feature, second_feature=None):
+    # (first feature, second feature) the table is stored under
+    if not second_feature:
+        return first_feature, ''
+    first, second = sorted([first_feature, second_feature], key=CUBE_COLUMNS.index)
+    return first, second
+
+def plain(value):
+    # numpy scalars -> the Python value, so every store gets the same types
+    return value.item() if hasattr(value, 'item') else value
+
+def cube_cells(cleaned_data):
+    # count per combination of the cube columns in cleaned rows
+    columns = cube_columns(cleaned_data.columns)
+    if not columns or not len(cleaned_data):
+        return pd.DataFrame(columns=columns + ['count'])
+    return cleaned_data.groupby(columns, observed=True).size().reset_index(name='count')
+
+def cube_entries(cells):
+    # the base cells rolled up into every one- and two-way table
+    columns = [column for column in cells.columns if column != 'count']
+    entries = []
+    for i, first in enumerate(columns):
+        for second in [None] + columns[i + 1:]:
+            grouped = cells.groupby([first, second] if second else [first], observed=True)['count'].sum()
+            for values, count in grouped.items():
+                values = values if isinstance(values, tuple) else (values,)
+                entries.append((first, second or '', plain(values[0]), plain(values[1]) if second else '', int(count)))
+    return entries
+
+def merge_entries(entries, new_entries):
+    # add the tables of newly arrived rows on
+    totals = {}
+    for entry in list(entries) + list(new_entries):
+        key = tuple(entry[:4])
+        totals[key] = totals.get(key, 0) + entry[4]
+    return [key + (count,) for key, count in totals.items()]
+
+def count_frame(rows, first_feature, second_feature=None):
+    # stored (first value, second value, count) rows -> the same table count_table and the query backends give
+    if not second_feature:
+        counts = pd.DataFrame([(first_value, count) for first_value, _, count in rows], columns=[first_feature, 'count'])
+        return counts.set_index(first_feature).sort_index()
+
+    # stored the other way round - swap the values back
+    if cube_key(first_feature, second_feature)[0] != first_feature:
+        rows = [(second_value, first_value, count) for first_value, second_value, count in rows]
+    counts = pd.DataFrame(rows, columns=[first_feature, second_feature, 'count'])
+    counts = counts.pivot(index=first_feature, columns=second_feature, values='count')
+    return counts.fillna(0).astype(int).sort_index()
+
+def lookup_entries(entries, first_feature, second_feature=None):
+    # count table from a list of entries (the CSV cube file)
+    key = cube_key(first_feature, second_feature)
+    rows = [(first_value, second_value, count) for first, second, first_value, second_value, count in entries
+            if (first, second) == key]
+    return count_frame(rows, first_feature, second_feature)
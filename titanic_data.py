@@ -0,0 +1,375 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import pandas as pd
+from titanic_cube import cube_cells, cube_entries, cube_signature, merge_entries
+from titanic_features import DERIVED_FEATURES, add_features, features_signature
+from titanic_trace import span
+
+# shared data pipeline used by titanic.py and all three GUIs
+
+# version stamp for the source data - bump it whenever the data changes
+# (e.g. after add_column_to_table or add_column_to_collection)
+data_version = 0
+# (version, rows) when the last change only appended rows, else None
+last_appended = None
+
+# single slot memo for the cleaned frame: (source frame, version, cleaned frame)
+_cleaned_cache = None
+
+# hit/miss counters for the cleaned frame cache
+cache_stats = {'hits': 0, 'misses': 0}
+
+# columns clean_data throws away before dropping rows with missing values
+DROPPED_COLUMNS = ['Cabin']
+
+# column that identifies a passenger - used to upsert rows that arrive later
+KEY_COLUMN = 'PassengerId'
+
+# where the columnar (Feather) copies of CSV files are kept
+COLUMNAR_CACHE_DIR = '.titanic_cache'
+
+# one thread at a time checks and (re)builds the columnar cache
+_columnar_lock = threading.RLock()
+
+# one thread at a time brings a CSV's cube up to date
+_cube_lock = threading.Lock()
+
+# compact in-memory types for the passenger table
+# nullable ints (capitalised) keep their type when a value is missing instead of turning into floats
+# columns not listed here get their types worked out by optimize_dtypes
+PASSENGER_SCHEMA = {
+    'PassengerId': 'UInt32',
+    'Survived': 'UInt8',
+    'Pclass': 'UInt8',
+    'Sex': 'category',
+    'Age': 'float32',
+    'SibSp': 'UInt8',
+    'Parch': 'UInt8',
+    'Fare': 'float32',
+    'Embarked': 'category',
+}
+
+# text columns with fewer distinct values than this share of the rows become categoricals
+CATEGORY_RATIO = 0.5
+
+def mark_data_changed(new_rows=None):
+    # new_rows - pass the rows when the change only appended them, so caches
+    # of additive results (count tables) can be updated instead of rebuilt
+    global data_version, _cleaned_cache, last_appended
+    data_version += 1
+    # drop the cached copy, it was built from the old data
+    _cleaned_cache = None
+    last_appended = (data_version, new_rows) if new_rows is not None else None
+    return data_version
+
+def clean_frame(data):
+    with span('clean_data'):
+        temp = data.drop(DROPPED_COLUMNS, axis=1, errors='ignore') # drop the Cabin column
+        temp = temp.dropna() # drop missing values
+    return temp
+
+def clean_data(data):
+    global _cleaned_cache
+    # reuse the cleaned frame if it was built from this exact frame at this version
+    if _cleaned_cache is not None:
+        source, version, cleaned = _cleaned_cache
+        if source is data and version == data_version:
+            cache_stats['hits'] += 1
+            return cleaned
+
+    cache_stats['misses'] += 1
+    temp = clean_frame(data)
+    _cleaned_cache = (data, data_version, temp)
+    return temp
+
+def get_cache_stats():
+    return dict(cache_stats, version=data_version)
+
+def memory_usage(data):
+    return int(data.memory_usage(deep=True).sum())
+
+def smallest_dtype(column):
+    # the narrowest type that holds every value, nullable for integer columns
+    if pd.api.types.is_bool_dtype(column):
+        return column.dtype
+    if pd.api.types.is_integer_dtype(column) or pd.api.types.is_float_dtype(column):
+        values = column.dropna()
+        if len(values) and (values != values.round()).any():
+            return 'float32'
+        if not len(values):
+            return column.dtype
+        downcast = 'unsigned' if values.min() >= 0 else 'integer'
+        return pd.to_numeric(values, downcast=downcast).dtype.name.capitalize().replace('Uint', 'UInt')
+    if column.nunique() < CATEGORY_RATIO * len(column):
+        return 'category'
+    return column.dtype
+
+def schema_dtypes(data, categories=True):
+    # the passenger schema (and derived feature) types for the columns data has
+    # categories=False leaves categoricals out - e.g. for chunks, whose categories wouldn't merge
+    types = dict(PASSENGER_SCHEMA, **{name: feature['dtype'] for name, feature in DERIVED_FEATURES.items()})
+    return {column: dtype for column, dtype in types.items() if column in data.columns and (categories or dtype != 'category')}
+
+def print_memory_report(before, after):
+    print(f'Memory: {before / 1024 ** 2:.2f} MB -> {after / 1024 ** 2:.2f} MB')
+
+def optimize_dtypes(data, schema=PASSENGER_SCHEMA, report=print_memory_report):
+    before = memory_usage(data)
+    dtypes = {column: schema.get(column) or smallest_dtype(data[column]) for column in data.columns}
+    data = data.astype(dtypes)
+    if report is not None:
+        report(before, memory_usage(data))
+    return data
+
+def file_digest(path, end=None, digest=None, start=0):
+    # sha256 of the file (or of its bytes from start up to end), carrying on from digest if given
+    if digest is None:
+        digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start if end is not None else None
+        while remaining is None or remaining > 0:
+            block = f.read(1024 * 1024 if remaining is None else min(1024 * 1024, remaining))
+            if not block:
+                break
+            digest.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return digest
+
+def file_hash(path, end=None):
+    return file_digest(path, end).hexdigest()
+
+def columnar_cache_paths(csv_path, cleaned, cache_dir=COLUMNAR_CACHE_DIR):
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    if cleaned:
+        name += '.cleaned'
+    return os.path.join(cache_dir, name + '.feather'), os.path.join(cache_dir, name + '.json')
+
+def columnar_cache_valid(csv_path, feather_path, meta_path):
+    if not (os.path.exists(feather_path) and os.path.exists(meta_path)):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    # built with other derived feature definitions - the derived columns need working out again
+    if meta.get('features') != features_signature():
+        return False
+    stat = os.stat(csv_path)
+    if meta['mtime'] == stat.st_mtime and meta['size'] == stat.st_size:
+        return True
+    # mtime moved (e.g. the file was copied) - the contents may still be the same
+    if meta['size'] != stat.st_size or meta['sha256'] != file_hash(csv_path):
+        return False
+    meta['mtime'] = stat.st_mtime
+    write_json(meta, meta_path)
+    return True
+
+def temp_path(path):
+    # a temp file of our own next to path, so it can be swapped in with os.replace
+    # (other threads or processes may be writing the same file)
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=os.path.dirname(path) or '.')
+    os.close(fd)
+    return tmp_path
+
+def write_json(value, path):
+    tmp_path = temp_path(path)
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def write_feather(data, path):
+    import pyarrow as pa
+    from pyarrow import feather
+    # uncompressed so the file can be memory mapped, written to a temp file then swapped in
+    tmp_path = temp_path(path)
+    try:
+        feather.write_feather(pa.Table.from_pandas(data, preserve_index=False), tmp_path, compression='uncompressed')
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def build_columnar_cache(csv_path, cache_dir=COLUMNAR_CACHE_DIR):
+    # one full parse of the CSV plus the derived features, saved both as-is and cleaned
+    with _columnar_lock:
+        os.makedirs(cache_dir, exist_ok=True)
+        data = add_features(optimize_dtypes(pd.read_csv(csv_path)))
+        stat = os.stat(csv_path)
+        meta = {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha256': file_hash(csv_path), 'features': features_signature()}
+        cleaned_data = clean_frame(data)
+        for cleaned, frame in [(False, data), (True, cleaned_data)]:
+            feather_path, meta_path = columnar_cache_paths(csv_path, cleaned, cache_dir)
+            write_feather(frame, feather_path)
+            write_json(meta, meta_path)
+        # and the cube of count tables, while the cleaned rows are in memory
+        with _cube_lock:
+            write_cube(csv_path, build_cube(csv_path, cleaned_data, meta), cache_dir)
+
+def ensure_columnar_cache(csv_path, cleaned):
+    # the Feather file for csv_path, built first if it's missing or stale
+    feather_path, meta_path = columnar_cache_paths(csv_path, cleaned)
+    with _columnar_lock:
+        if not columnar_cache_valid(csv_path, feather_path, meta_path):
+            build_columnar_cache(csv_path)
+            # anything cached from the old copy of the file is stale now
+            mark_data_changed()
+    return feather_path
+
+def cube_path(csv_path, cache_dir=COLUMNAR_CACHE_DIR):
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(cache_dir, name + '.cube.json')
+
+def ends_with_newline(csv_path, size):
+    if not size:
+        return False
+    with open(csv_path, 'rb') as f:
+        f.seek(size - 1)
+        return f.read(1) == b'\n'
+
+def build_cube(csv_path, cleaned_data, meta):
+    # the data cube (titanic_cube) of the cleaned rows, and what it was built from
+    # newline - whether the file ended on a complete line, so appended bytes are whole new rows
+    return {'mtime': meta['mtime'], 'size': meta['size'], 'sha256': meta['sha256'],
+            'newline': ends_with_newline(csv_path, meta['size']), 'columns': list(cleaned_data.columns),
+            'signature': cube_signature(cleaned_data.columns), 'entries': cube_entries(cube_cells(cleaned_data))}
+
+def write_cube(csv_path, cube, cache_dir=COLUMNAR_CACHE_DIR):
+    write_json(cube, cube_path(csv_path, cache_dir))
+
+def load_cube(csv_path):
+    # the CSV's cube, with the counts of any rows appended to the CSV since it was built added on
+    # None if there's no cube that fits the file - the next columnar cache build makes one
+    path = cube_path(csv_path)
+    with _cube_lock:
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            cube = json.load(f)
+        # built with another cube version or other derived features
+        if cube['signature'] != cube_signature(cube['columns']):
+            return None
+        stat = os.stat(csv_path)
+        if stat.st_mtime == cube['mtime'] and stat.st_size == cube['size']:
+            return cube
+        # the file changed - it's only new rows if what the cube was built from is still the start of it
+        if stat.st_size < cube['size']:
+            return None
+        digest = file_digest(csv_path, cube['size'])
+        if digest.hexdigest() != cube['sha256']:
+            return None
+        if stat.st_size > cube['size']:
+            if not cube['newline']:
+                # the last line was still being written - its row may have been counted half done
+                return None
+            # count just the appended rows (cleaned, with their derived features) and add them on
+            new_rows, end_offset = read_csv_since(csv_path, cube['size'])
+            if end_offset > cube['size']:
+                new_data = add_features(optimize_dtypes(new_rows, report=None))
+                cube['entries'] = merge_entries(cube['entries'], cube_entries(cube_cells(clean_frame(new_data))))
+                cube['sha256'] = file_digest(csv_path, end_offset, digest, cube['size']).hexdigest()
+                cube['size'], cube['newline'] = end_offset, True
+                # cached count tables can take the new rows on too
+                mark_data_changed(new_data)
+        cube['mtime'] = stat.st_mtime
+        write_cube(csv_path, cube)
+        return cube
+
+def have_pyarrow():
+    try:
+        import pyarrow
+        return True
+    except ImportError:
+        return False
+
+def load_columns(csv_path, columns=None, cleaned=False):
+    # without pyarrow fall back to parsing the CSV (only the columns asked for)
+    if not have_pyarrow():
+        data = add_features(optimize_dtypes(pd.read_csv(csv_path)))
+        if cleaned:
+            data = clean_frame(data)
+        return data[columns] if columns else data
+
+    feather_path = ensure_columnar_cache(csv_path, cleaned)
+
+    from pyarrow import feather
+    # memory mapped, and only the projected columns are read
+    table = feather.read_table(feather_path, columns=columns, memory_map=True)
+    if columns:
+        # keep the order the columns were asked for
+        table = table.select(columns)
+    return table.to_pandas()
+
+def load_column_names(csv_path):
+    if not have_pyarrow():
+        return list(add_features(pd.read_csv(csv_path, nrows=0)).columns)
+
+    feather_path = ensure_columnar_cache(csv_path, False)
+
+    import pyarrow as pa
+    with pa.memory_map(feather_path) as source:
+        return pa.ipc.open_file(source).schema.names
+
+def csv_end_offset(csv_path):
+    # byte offset just past the last complete line - a half written last line is left for next time
+    size = os.path.getsize(csv_path)
+    with open(csv_path, 'rb') as f:
+        position = size
+        while position > 0:
+            start = max(0, position - 64 * 1024)
+            f.seek(start)
+            block = f.read(position - start)
+            newline = block.rfind(b'\n')
+            if newline != -1:
+                return start + newline + 1
+            position = start
+    return 0
+
+def read_csv_since(csv_path, offset, end_offset=None, columns=None):
+    # rows appended to the CSV after byte offset, and the offset to carry on from next time
+    # (also reads any line aligned byte range - columns limits it to just those columns)
+    with open(csv_path, 'rb') as f:
+        header = f.readline()
+        names = next(csv.reader([header.decode()]))
+        usecols = [column for column in names if column in columns] if columns is not None else None
+        offset = max(offset, len(header))
+        if end_offset is None:
+            end_offset = csv_end_offset(csv_path)
+        if end_offset <= offset:
+            return pd.DataFrame(columns=usecols or names), max(offset, end_offset)
+        f.seek(offset)
+        new_bytes = f.read(end_offset - offset)
+    return pd.read_csv(io.BytesIO(new_bytes), header=None, names=names, usecols=usecols), end_offset
+
+def apply_new_rows(data, new_rows, key=KEY_COLUMN):
+    # upsert rows into an in-memory frame, and carry the cleaned frame forward
+    # by cleaning only the new rows instead of the whole table again
+    global _cleaned_cache
+    previous = _cleaned_cache
+    replaced = data[key].isin(new_rows[key])
+    updated = append_rows(data[~replaced], new_rows)
+
+    version = mark_data_changed(None if replaced.any() else new_rows)
+    if previous is not None and previous[0] is data:
+        cleaned = previous[2]
+        cleaned = cleaned[~cleaned[key].isin(new_rows[key])]
+        cleaned = append_rows(cleaned, clean_frame(new_rows))
+        _cleaned_cache = (updated, version, cleaned)
+    return updated
+
+def append_rows(data, new_rows):
+    # new rows on the end, in data's types - categoricals take on any new values as new categories
+    # (casting to data's categorical type would turn values it hasn't seen into NaN)
+    dtypes = {column: dtype for column, dtype in data.dtypes.items() if not isinstance(dtype, pd.CategoricalDtype)}
+    combined = pd.concat([data, new_rows.astype(dtypes, errors='ignore')], ignore_index=True)
+    categoricals = [column for column, dtype in data.dtypes.items()
+                    if isinstance(dtype, pd.CategoricalDtype) and not isinstance(combined[column].dtype, pd.CategoricalDtype)]
+    return combined.astype({column: 'category' for column in categoricals}) if categoricals else combined
@@ -0,0 +1,92 @@
+import math
+
+# derived features - columns worked out from the passenger columns, declared once here
+# and computed with whole-column (vectorised) pandas ops, never row by row
+# they're stored alongside the source columns so the GUIs plot them like any other column:
+#   CSV      - in the columnar cache, rebuilt when the CSV or a feature definition changes
+#   SQLite   - typed columns filled in bulk (titanic_sqlite.store_features)
+#   MongoDB  - fields set with bulk writes (titanic_mongo.store_features)
+# the databases record which version of each feature was stored at which source version,
+# so they're only recomputed when the data or the definition changes (and synced rows only for themselves)
+#
+# a feature is:
+#   inputs   - the columns it's computed from (it's only offered when they're all there)
+#   compute  - function(frame) -> Series, given a frame with at least the inputs
+#   dtype    - pandas dtype it's stored as (the SQL type follows from it)
+#   version  - bump it when compute changes, so stored values are recomputed
+# a missing input gives a missing value, never the other way round, so cleaning keeps the same rows
+# pandas is only imported to compute them - the GUIs list the feature names before it has loaded
+
+def family_size(data):
+    # siblings/spouses plus parents/children aboard (the passenger not included, as in titanic.py)
+    return data['SibSp'] + data['Parch']
+
+# (upper bound, label) - ages below the bound get the label (labels sort in age order, as bar plots sort them)
+AGE_BANDS = [(12, '0-11'), (18, '12-17'), (30, '18-29'), (50, '30-49'), (65, '50-64'), (math.inf, '65+')]
+
+def age_band(data):
+    import pandas as pd
+    edges = [-math.inf] + [bound for bound, _ in AGE_BANDS]
+    bands = pd.cut(data['Age'], edges, labels=[label for _, label in AGE_BANDS], right=False)
+    return bands.astype(object).where(bands.notna(), None)
+
+# decimal places FarePerPerson is rounded to - the databases keep it as float64 and the frames as float32,
+# rounded values compare the same in both (24.15 / 3 is 8.049999999999999 otherwise, which only float32 calls 8.05)
+FARE_DECIMALS = 4
+
+def fare_per_person(data):
+    # the fare was per ticket, shared by the family travelling on it
+    return (data['Fare'] / (data['SibSp'] + data['Parch'] + 1)).round(FARE_DECIMALS)
+
+def title(data):
+    # 'Braund, Mr. Owen Harris' -> 'Mr' - names without a title become 'Unknown' rather than missing
+    titles = data['Name'].astype(str).str.extract(r',\s*([^.]+)\.', expand=False).str.strip()
+    return titles.fillna('Unknown').where(data['Name'].notna(), None)
+
+DERIVED_FEATURES = {
+    'FamilySize': {'inputs': ['SibSp', 'Parch'], 'compute': family_size, 'dtype': 'UInt8', 'version': 1},
+    'AgeBand': {'inputs': ['Age'], 'compute': age_band, 'dtype': 'category', 'version': 1},
+    'FarePerPerson': {'inputs': ['Fare', 'SibSp', 'Parch'], 'compute': fare_per_person, 'dtype': 'float32', 'version': 2},
+    'Title': {'inputs': ['Name'], 'compute': title, 'dtype': 'category', 'version': 1},
+}
+
+def derived_names(columns):
+    # the features that can be computed from these columns (and aren't source columns already)
+    return [name for name, feature in DERIVED_FEATURES.items()
+            if name not in columns and all(column in columns for column in feature['inputs'])]
+
+def feature_inputs(names):
+    return list(dict.fromkeys(column for name in names for column in DERIVED_FEATURES[name]['inputs']))
+
+def feature_signature(name):
+    # what a stored feature was computed with - if this changes the stored values are stale
+    feature = DERIVED_FEATURES[name]
+    return f"{feature['version']}:{','.join(feature['inputs'])}"
+
+def features_signature(names=None):
+    return ';'.join(f'{name}={feature_signature(name)}' for name in (names if names is not None else DERIVED_FEATURES))
+
+def derive_features(data, names=None):
+    # frame of just the derived columns, same index as data
+    import pandas as pd
+    if names is None:
+        names = derived_names(data.columns)
+    derived = pd.DataFrame(index=data.index)
+    for name in names:
+        feature = DERIVED_FEATURES[name]
+        values = feature['compute'](data)
+        # integers get their nullable type (no 1.0s where an input column had gaps), floats stay float64
+        # until add_features narrows them, so the databases don't store float32 approximations
+        if pd.api.types.is_integer_dtype(pd.api.types.pandas_dtype(feature['dtype'])):
+            values = values.astype(feature['dtype'])
+        derived[name] = values
+    return derived
+
+def add_features(data, names=None):
+    # data with the derived columns on the end
+    import pandas as pd
+    derived = derive_features(data, names)
+    if not len(derived.columns):
+        return data
+    derived = derived.astype({name: DERIVED_FEATURES[name]['dtype'] for name in derived.columns})
+    return pd.concat([data, derived], axis=1)
@@ -0,0 +1,56 @@
+import operator
+import re
+
+# row filters for the GUIs' filter box, e.g. "Pclass == 1, Sex == female, Age >= 18"
+# a filter is a (column, op, value) tuple - tuples so they can be part of a render cache key
+# each backend turns them into its own form: SQL WHERE terms, a $match, or a pandas boolean mask
+
+# op -> (python operator, SQL operator, mongo operator)
+FILTER_OPS = {
+    '==': (operator.eq, '=', '$eq'),
+    '!=': (operator.ne, '!=', '$ne'),
+    '<': (operator.lt, '<', '$lt'),
+    '<=': (operator.le, '<=', '$lte'),
+    '>': (operator.gt, '>', '$gt'),
+    '>=': (operator.ge, '>=', '$gte'),
+}
+
+# column, op, value (quoted values can hold commas) - conditions are separated by commas or 'and'
+CONDITION = re.compile(r'\s*([^,=!<>]+?)\s*(==|!=|<=|>=|<|>|=)\s*("[^"]*"|\'[^\']*\'|.+?)\s*(?:,|\band\b|$)', re.IGNORECASE)
+
+def parse_value(text):
+    # numbers become numbers, anything else is text (quotes optional)
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in '\'"':
+        return text[1:-1]
+    for number_type in (int, float):
+        try:
+            return number_type(text)
+        except ValueError:
+            pass
+    return text
+
+def parse_filters(text):
+    filters = []
+    text = (text or '').strip()
+    position = 0
+    while position < len(text):
+        match = CONDITION.match(text, position)
+        if match is None:
+            raise ValueError(f"Can't read filter '{text[position:].strip()}' - use e.g. Pclass == 1")
+        column, op, value = match.groups()
+        filters.append((column, '==' if op == '=' else op, parse_value(value)))
+        position = match.end()
+    return tuple(filters)
+
+def filter_columns(filters):
+    return [column for column, _, _ in filters]
+
+def filter_mask(data, filters):
+    # vectorised - one boolean Series per condition, and-ed together
+    mask = None
+    for column, op, value in filters:
+        if column not in data.columns:
+            raise ValueError(f"Unknown column '{column}'")
+        condition = FILTER_OPS[op][0](data[column], value)
+        mask = condition if mask is None else mask & condition
+    return mask
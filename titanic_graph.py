@@ -0,0 +1,91 @@
+import numpy as np
+import matplotlib.pyplot as plt
+import seaborn as sb
+from titanic_aggregate import aggregate_graph_data
+from titanic_trace import span
+
+# shared plotting code for the GUIs
+# plots are drawn from the small summary arrays built by titanic_aggregate
+# so the render cost doesn't grow with the number of rows
+
+def draw_counts(ax, counts, first_feature, second_feature=None):
+    categories = [str(value) for value in counts.index]
+    positions = np.arange(len(categories))
+    colours = sb.color_palette()
+
+    if not second_feature:
+        ax.bar(positions, counts.iloc[:, 0].to_numpy(), width=0.8, color=colours[0])
+    else:
+        # grouped bars, one bar per second feature value inside each category
+        n_groups = len(counts.columns)
+        width = 0.8 / n_groups
+        for i, hue_value in enumerate(counts.columns):
+            offset = -0.4 + width * (i + 0.5)
+            ax.bar(positions + offset, counts[hue_value].to_numpy(), width=width,
+                   color=colours[i % len(colours)], label=str(hue_value))
+        ax.legend(title=second_feature)
+
+    ax.set_xticks(positions)
+    ax.set_xticklabels(categories)
+    ax.set_xlabel(first_feature)
+    ax.set_ylabel('count')
+
+def draw_histogram(ax, aggregates):
+    edges = aggregates['hist_edges']
+    colour = sb.color_palette()[0]
+    ax.bar(edges[:-1], aggregates['hist_counts'], width=np.diff(edges), align='edge',
+           color=colour, alpha=0.75, edgecolor='white')
+    if aggregates['kde_y'] is not None:
+        ax.plot(aggregates['kde_x'], aggregates['kde_y'], color=colour)
+    ax.set_xlabel(aggregates['first_feature'])
+    ax.set_ylabel('Count')
+
+def draw_boxes(ax, boxes, first_feature, second_feature):
+    # box plots from precomputed quartiles/whiskers/fliers (titanic_stream), one box per first feature value
+    artists = ax.bxp(boxes, patch_artist=True)
+    for patch, colour in zip(artists['boxes'], sb.color_palette(n_colors=len(boxes))):
+        patch.set_facecolor(colour)
+    ax.set_xlabel(first_feature)
+    ax.set_ylabel(second_feature)
+
+def draw_graph(aggregates, selected_colour_palette, ax=None):
+    if ax is None:
+        # set target figure size in inches
+        plt.figure(figsize=(8, 6))
+        ax = plt.gca()
+    #  use seaborn function to select palette from user selection
+    sb.set_palette(selected_colour_palette)
+
+    first_feature = aggregates.get('first_feature')
+    second_feature = aggregates.get('second_feature')
+
+    # conditonal test for chosen graph type
+    if aggregates['graph_type'] == 'Bar Plot':
+        draw_counts(ax, aggregates['counts'], first_feature, second_feature)
+        if second_feature:
+            ax.set_title(f'Bar Plot of {first_feature} by {second_feature}')
+        else:
+            ax.set_title(f'Bar Plot of {first_feature}')
+    elif aggregates['graph_type'] == 'Histogram':
+        if 'counts' in aggregates:
+            draw_counts(ax, aggregates['counts'], first_feature)
+        else:
+            draw_histogram(ax, aggregates)
+        ax.set_title(f'Histogram of {first_feature}')
+    elif aggregates['graph_type'] == 'Box Plot':
+        draw_boxes(ax, aggregates['boxes'], first_feature, second_feature)
+        ax.set_title(f'Box Plot of {second_feature} by {first_feature}')
+
+    # previews are estimated from a sample, say so until the exact graph replaces them
+    if aggregates.get('approximate'):
+        ax.set_title(ax.get_title() + ' (preview)')
+
+    return ax
+
+def create_graph(selected_graph_type, selected_first_feature, selected_second_feature, selected_colour_palette, cleaned_data, selected_bins):
+    # aggregate once with vectorised pandas/numpy ops, then plot the summary
+    with span('aggregate'):
+        aggregates = aggregate_graph_data(selected_graph_type, selected_first_feature, selected_second_feature, cleaned_data, selected_bins)
+    with span('create_graph'):
+        draw_graph(aggregates, selected_colour_palette)
+    return plt
@@ -1,37 +1,43 @@
-import pandas as pd
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import seaborn as sb
-
-titanic_data = pd.read_csv('train.csv')
-
-def clean_data(data):
-    temp = data.drop('Cabin', axis=1) # drop the Cabin column
-    temp = data.dropna() # drop missing values
-    return temp
-
-def create_graph(selected_graph_type, selected_first_feature, selected_second_feature, selected_colour_palette, cleaned_data, selected_bins):
-    # set target figure size in inches
-    plt.figure(figsize=(8, 6))
-    #  use seaborn function to select palette from user selection
-    sb.set_palette(selected_colour_palette)
-
-    # conditonal test for chosen graph type
-    if selected_graph_type == 'Bar Plot':
-        if selected_second_feature:
-            sb.countplot(x=selected_first_feature, data=cleaned_data, hue=selected_second_feature)
-            plt.title(f'Bar Plot of {selected_first_feature} by {selected_second_feature}')
-        else:
-            sb.countplot(x=selected_first_feature, data=cleaned_data)
-            plt.title(f'Bar Plot of {selected_first_feature}')
-    elif selected_graph_type == 'Histogram':
-        sb.histplot(cleaned_data[selected_first_feature], kde=True, bins=selected_bins)
-        plt.title(f'Histogram of {selected_first_feature}')
-
-    return plt
+from titanic_backends import CSVBackend, ServerBackend, server_address
+from titanic_filters import parse_filters
+from titanic_scheduler import RenderScheduler
+from titanic_startup import mark, preload, startup_report, wants_startup_report
+from titanic_trace import PerfMonitor, tracing, wants_profile
+
+# pandas/matplotlib/seaborn are imported lazily (in the functions that use them)
+# so the window can appear before they've loaded
+
+# the CSV itself, read through the memory mapped columnar cache
+# (or with --server [ADDRESS], a thin client of a shared titanic_server that holds the data instead)
+backend = ServerBackend(server_address()) if server_address() else CSVBackend('train.csv')
+
+# only the column names are needed up front - read straight from the CSV header
+csv_columns = backend.columns()
+
+# built on the first graph, once matplotlib has been imported
+graph_canvas = None
+
+def load_data():
+    # runs in the background after the window is up - builds (or checks) the columnar cache
+    return backend.load()
+
+def data_loaded(columns):
+    mark('data loaded')
+    if wants_startup_report():
+        print(startup_report())
+
+def show_graph(aggregates, selected_colour_palette, trace=None):
+    # runs on the Tk thread once the background work has finished
+    # redraws into the same figure and canvas every time
+    global graph_canvas
+    with tracing(trace):
+        if graph_canvas is None:
+            from titanic_canvas import GraphCanvas
+            graph_canvas = GraphCanvas(graph_frame)
+        graph_canvas.show(aggregates, selected_colour_palette)
 
 def generate_graph():
     # get references to user selections
@@ -49,24 +55,60 @@ def generate_graph():
         # return will 'exit' the function early
         return
 
-    # process and clean the data  using clean_data function
-    # cleaned data is returned and stored in 'cleaned_data'
-    cleaned_data = clean_data(titanic_data)
-
-    plt = create_graph(selected_graph_type, selected_first_feature, selected_second_feature, selected_colour_palette, cleaned_data, selected_bins)
+    # rows to keep ('Pclass == 1, Sex == female') and how many to sample (0 = all of them)
+    try:
+        filters = parse_filters(filter_entry.get())
+    except ValueError as e:
+        messagebox.showerror("Error", str(e))
+        return
+    try:
+        selected_sample = int(sample_entry.get() or 0)
+    except:
+        messagebox.showerror("Error", "Number of sample rows must be an integer")
+        return
 
-    for widget in graph_frame.winfo_children():
-        widget.destroy()
+    from titanic_aggregate import get_cached_aggregates, render_cache_key
 
-    canvas = FigureCanvasTkAgg(plt.gcf(), master=graph_frame)
-    canvas.draw()
-    canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=1)
+    # seen this exact graph before at this data version - draw it straight from the cache
+    cache_key = render_cache_key(selected_graph_type, selected_first_feature, selected_second_feature, selected_bins, filters, selected_sample)
+    # every render is timed stage by stage, the timings show up once it's on screen
+    label = ' '.join(part for part in [selected_graph_type, selected_first_feature, selected_second_feature] if part)
+    aggregates = get_cached_aggregates(cache_key)
+    if aggregates is not None:
+        render_scheduler.cancel()
+        show_graph(aggregates, selected_colour_palette, perf_monitor.start(f'{label} (cached)'))
+        return
+    trace = perf_monitor.start(label)
+    preview_trace = perf_monitor.start(f'{label} (preview)')
+
+    # load the cleaned data for just the selected columns, then aggregate it for plotting
+    def work():
+        with tracing(trace):
+            return backend.render(cache_key, selected_graph_type, selected_first_feature, selected_second_feature, selected_bins, filters, selected_sample)
+
+    def preview_work():
+        with tracing(preview_trace):
+            return backend.preview(selected_graph_type, selected_first_feature, selected_second_feature, selected_bins, filters)
+
+    # the heavy lifting runs off the Tk thread - if another render is still going,
+    # this click replaces any waiting one and only the newest result gets drawn
+    on_done = lambda aggregates: show_graph(aggregates, selected_colour_palette, preview_trace if aggregates.get('approximate') else trace)
+    on_error = lambda e: messagebox.showerror("Error", f"Failed to generate graph: {e}")
+    if preview_var.get() and not selected_sample:
+        # progressive - a sampled estimate first, then the exact graph replaces it
+        render_scheduler.submit_progressive([preview_work, work], on_done, on_error)
+    else:
+        render_scheduler.submit(work, on_done, on_error)
 
     return
 
 # GUI init
 window = tk.Tk()
 window.title("Titanic Data Analysis")
+render_scheduler = RenderScheduler(window)
+# no console box in this GUI - render timings and a rolling p50/p95 go to stdout
+# (--profile-slow also saves profiles of slow renders)
+perf_monitor = PerfMonitor(print, wants_profile())
 
 # Dropdown selection for graph type
 graph_type_label = ttk.Label(window, text="Select graph type:")
@@ -80,7 +122,7 @@ graph_type_dropdown.pack()
 #  Dropdown to select first feature
 first_feature_label = ttk.Label(window, text="Select first feature:")
 first_feature_label.pack()
-features = list(titanic_data.columns)
+features = csv_columns
 first_feature_var = tk.StringVar(window)
 first_feature_var.set(features[0])
 first_feature_dropdown =  ttk.Combobox(window, textvariable=first_feature_var, value=features)
@@ -102,6 +144,24 @@ bins_entry = ttk.Entry(window)
 bins_entry.pack()
 bins_entry.insert(0, 0)
 
+# Input box for filters
+filter_label = ttk.Label(window, text="Filter rows (e.g. Pclass == 1, Sex == female):")
+filter_label.pack()
+filter_entry = ttk.Entry(window)
+filter_entry.pack()
+
+# Input box for sampling
+sample_label = ttk.Label(window, text="Sample rows (0 = all):")
+sample_label.pack()
+sample_entry = ttk.Entry(window)
+sample_entry.pack()
+sample_entry.insert(0, 0)
+
+# Tick box for progressive rendering - a quick estimate from a sample, then the exact graph
+preview_var = tk.BooleanVar(window, value=True)
+preview_check = ttk.Checkbutton(window, text="Fast preview first", variable=preview_var)
+preview_check.pack()
+
 #  Dropdown for colour palette selection
 colour_palette_label = ttk.Label(window, text="Select colour palette:")
 colour_palette_label.pack()
@@ -119,5 +179,10 @@ graph_frame.pack()
 generate_button = ttk.Button(window, text="Generate Graph", command=generate_graph)
 generate_button.pack()
 
+# Load the data and the heavy modules in the background once the window is showing
+window.after_idle(lambda: mark('window shown'))
+preload()
+render_scheduler.submit(load_data, data_loaded, lambda e: messagebox.showerror("Error", f"Failed to load data: {e}"), keep=True)
+
 # GUI render
 window.mainloop()
\ No newline at end of file
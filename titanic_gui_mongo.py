@@ -1,91 +1,91 @@
-import pandas as pd
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
 from tkinter import scrolledtext
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import seaborn as sb
-import pymongo
-from pymongo import MongoClient
+from titanic_backends import MongoBackend, ServerBackend, server_address
+from titanic_filters import parse_filters
+from titanic_scheduler import RenderScheduler
+from titanic_startup import mark, preload, startup_report, wants_startup_report
+from titanic_trace import PerfMonitor, tracing, wants_profile
 from dotenv import load_dotenv
 import os
 
+# pandas/matplotlib/seaborn are imported lazily (in the functions that use them)
+# so the window can appear before they've loaded
+
 load_dotenv()
 
 # Get DB URL from .env
 db_connect = os.getenv("DATABASE_URL")
-# Connect to MongoDB
-client = MongoClient(db_connect)
-db = client['Titanic-Data']
-collection = db['Titanic-V1']
-
-# If no object (JSON) data exists in collection
-if collection.count_documents({}) == 0:
-    # Load CSV
-    titanic_data = pd.read_csv('train.csv')
-    # Insert data into MongoDB
-    collection.insert_many(titanic_data.to_dict('records'))
-
-def get_data_from_mongodb():
-    try:
-        data = pd.DataFrame(list(collection.find()))
-        print('Data retrieved from MongoDB')
-        return data
-    except Exception as e:
-        print(f'Failed to retrieve data from MongoDB: {e}')
-        return pd.DataFrame()
-    
-# Call get_data_from_mongodb
-titanic_data = get_data_from_mongodb()
+# Connect to MongoDB - pooled, thread safe client behind the backend interface
+# (or with --server [ADDRESS], a thin client of a shared titanic_server that holds the data instead)
+backend = ServerBackend(server_address()) if server_address() else MongoBackend(db_connect, 'Titanic-Data', 'Titanic-V1', 'train.csv')
+
+# built on the first graph, once matplotlib has been imported
+graph_canvas = None
+
+def load_data():
+    # runs in the background after the window is up
+    # seeds an empty collection from the CSV, otherwise syncs rows appended since
+    return backend.load()
+
+def features_stored(stats):
+    # derived features (titanic_features) and the data cube (titanic_cube) if they had to be worked out and stored
+    if stats.get('features'):
+        console_output.insert(tk.END, f"Derived features stored: {', '.join(stats['features'])}\n")
+    if stats.get('cube'):
+        console_output.insert(tk.END, f"Data cube built ({stats['cube']['cells']} cells, {stats['cube']['seconds']:.2f}s)\n")
+
+def data_synced(stats):
+    console_output.insert(tk.END, f"Synced {stats['rows']} new documents from train.csv\n")
+    features_stored(stats)
+
+def data_loaded(stats):
+    mark('data loaded')
+    if 'new_rows' in stats:
+        data_synced(stats)
+    else:
+        console_output.insert(tk.END, f"Data inserted into MongoDB ({stats['documents']} documents, {stats['documents_per_second']:.0f} docs/s)\n")
+        features_stored(stats)
+    if wants_startup_report():
+        print(startup_report())
+    # TESTING PURPOSES
+    add_column_to_collection("Titanic-V1", "Test", 1)
+
+# Plots are aggregated inside MongoDB, so only the field names are needed up front
+collection_columns = backend.columns()
 
 def connect_to_mongodb():
     try:
-        client.server_info()
+        backend.ping()
         console_output.insert(tk.END, 'Connected to MongoDB!\n')
     except Exception as e:
         console_output.insert(tk.END,'Failed to connect to MongoDB.\n')
 
 # Function to add single column of data to dataset
 def add_column_to_collection(collection_name, column_name, default_value=None):
-    try:
-        # First check to see if column already exists
-        if column_name is db[collection_name].find_one({}):
+    # Adds the field unless it already exists (bumps the data version if it was added)
+    # runs on the load worker (it rewrites every row and rebuilds the cube), the outcome is reported back on the Tk thread
+    def column_added(added):
+        if not added:
             # If it does output message and exit function using return
             console_output.insert(tk.END, f"Column '{column_name} already exists in {collection_name}\n")
             return
-        
-        # If the column does not exist continue and do this
-        db[collection_name].update_many({}, {'$set': {column_name: default_value}})
         # Confirm entry by outputting to the console output box
         console_output.insert(tk.END, f"Column '{column_name} successfully added to {collection_name}\n")
-    except Exception as e:
-        console_output.insert(tk.END, f"Error adding column '{column_name}' to collection '{collection_name}: {e}")
-
-def clean_data(data):
-    temp = data.drop('Cabin', axis=1) # drop the Cabin column
-    temp = data.dropna() # drop missing values
-    return temp
-
-def create_graph(selected_graph_type, selected_first_feature, selected_second_feature, selected_colour_palette, cleaned_data, selected_bins):
-    # set target figure size in inches
-    plt.figure(figsize=(8, 6))
-    #  use seaborn function to select palette from user selection
-    sb.set_palette(selected_colour_palette)
-
-    # conditonal test for chosen graph type
-    if selected_graph_type == 'Bar Plot':
-        if selected_second_feature:
-            sb.countplot(x=selected_first_feature, data=cleaned_data, hue=selected_second_feature)
-            plt.title(f'Bar Plot of {selected_first_feature} by {selected_second_feature}')
-        else:
-            sb.countplot(x=selected_first_feature, data=cleaned_data)
-            plt.title(f'Bar Plot of {selected_first_feature}')
-    elif selected_graph_type == 'Histogram':
-        sb.histplot(cleaned_data[selected_first_feature], kde=True, bins=selected_bins)
-        plt.title(f'Histogram of {selected_first_feature}')
-
-    return plt
+
+    load_scheduler.submit(lambda: backend.add_column(column_name, default_value), column_added,
+                          lambda e: console_output.insert(tk.END, f"Error adding column '{column_name}' to collection '{collection_name}: {e}"), keep=True)
+
+def show_graph(aggregates, selected_colour_palette, trace=None):
+    # runs on the Tk thread once the background work has finished
+    # redraws into the same figure and canvas every time
+    global graph_canvas
+    with tracing(trace):
+        if graph_canvas is None:
+            from titanic_canvas import GraphCanvas
+            graph_canvas = GraphCanvas(graph_frame)
+        graph_canvas.show(aggregates, selected_colour_palette)
 
 def generate_graph():
     # get references to user selections
@@ -103,24 +103,61 @@ def generate_graph():
         # return will 'exit' the function early
         return
 
-    # process and clean the data  using clean_data function
-    # cleaned data is returned and stored in 'cleaned_data'
-    cleaned_data = clean_data(titanic_data)
+    # rows to keep ('Pclass == 1, Sex == female') and how many to sample (0 = all of them)
+    try:
+        filters = parse_filters(filter_entry.get())
+    except ValueError as e:
+        messagebox.showerror("Error", str(e))
+        return
+    try:
+        selected_sample = int(sample_entry.get() or 0)
+    except:
+        messagebox.showerror("Error", "Number of sample rows must be an integer")
+        return
+
+    from titanic_aggregate import get_cached_aggregates, render_cache_key
 
-    plt = create_graph(selected_graph_type, selected_first_feature, selected_second_feature, selected_colour_palette, cleaned_data, selected_bins)
+    # seen this exact graph before at this data version - draw it straight from the cache
+    cache_key = render_cache_key(selected_graph_type, selected_first_feature, selected_second_feature, selected_bins, filters, selected_sample)
+    # every render is timed stage by stage, the timings show up once it's on screen
+    label = ' '.join(part for part in [selected_graph_type, selected_first_feature, selected_second_feature] if part)
+    aggregates = get_cached_aggregates(cache_key)
+    if aggregates is not None:
+        render_scheduler.cancel()
+        show_graph(aggregates, selected_colour_palette, perf_monitor.start(f'{label} (cached)'))
+        return
+    trace = perf_monitor.start(label)
+    preview_trace = perf_monitor.start(f'{label} (preview)')
+
+    # clean and aggregate inside MongoDB, only the grouped buckets come back
+    def work():
+        with tracing(trace):
+            return backend.render(cache_key, selected_graph_type, selected_first_feature, selected_second_feature, selected_bins, filters, selected_sample)
 
-    for widget in graph_frame.winfo_children():
-        widget.destroy()
+    def preview_work():
+        with tracing(preview_trace):
+            return backend.preview(selected_graph_type, selected_first_feature, selected_second_feature, selected_bins, filters)
 
-    canvas = FigureCanvasTkAgg(plt.gcf(), master=graph_frame)
-    canvas.draw()
-    canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=1)
+    # the heavy lifting runs off the Tk thread - if another render is still going,
+    # this click replaces any waiting one and only the newest result gets drawn
+    on_done = lambda aggregates: show_graph(aggregates, selected_colour_palette, preview_trace if aggregates.get('approximate') else trace)
+    on_error = lambda e: messagebox.showerror("Error", f"Failed to query MongoDB: {e}")
+    if preview_var.get() and not selected_sample:
+        # progressive - a sampled estimate first, then the exact graph replaces it
+        render_scheduler.submit_progressive([preview_work, work], on_done, on_error)
+    else:
+        render_scheduler.submit(work, on_done, on_error)
 
     return
 
 # GUI init
 window = tk.Tk()
 window.title("Titanic Data Analysis")
+render_scheduler = RenderScheduler(window)
+# syncs run on their own worker, so they don't hold up renders (or the other way round)
+load_scheduler = RenderScheduler(window)
+# render timings and a rolling p50/p95 in the console (--profile-slow also saves profiles of slow renders)
+perf_monitor = PerfMonitor(lambda text: console_output.insert(tk.END, text + '\n'), wants_profile())
 
 # Dropdown selection for graph type
 graph_type_label = ttk.Label(window, text="Select graph type:")
@@ -134,7 +171,7 @@ graph_type_dropdown.pack()
 #  Dropdown to select first feature
 first_feature_label = ttk.Label(window, text="Select first feature:")
 first_feature_label.pack()
-features = list(titanic_data.columns)
+features = collection_columns
 first_feature_var = tk.StringVar(window)
 first_feature_var.set(features[0])
 first_feature_dropdown = ttk.Combobox(window, textvariable=first_feature_var, value=features)
@@ -156,6 +193,24 @@ bins_entry = ttk.Entry(window)
 bins_entry.pack()
 bins_entry.insert(0, 0)
 
+# Input box for filters
+filter_label = ttk.Label(window, text="Filter rows (e.g. Pclass == 1, Sex == female):")
+filter_label.pack()
+filter_entry = ttk.Entry(window)
+filter_entry.pack()
+
+# Input box for sampling
+sample_label = ttk.Label(window, text="Sample rows (0 = all):")
+sample_label.pack()
+sample_entry = ttk.Entry(window)
+sample_entry.pack()
+sample_entry.insert(0, 0)
+
+# Tick box for progressive rendering - a quick estimate from a sample, then the exact graph
+preview_var = tk.BooleanVar(window, value=True)
+preview_check = ttk.Checkbutton(window, text="Fast preview first", variable=preview_var)
+preview_check.pack()
+
 #  Dropdown for colour palette selection
 colour_palette_label = ttk.Label(window, text="Select colour palette:")
 colour_palette_label.pack()
@@ -187,8 +242,15 @@ console_output.pack()
 connect_button = ttk.Button(window, text="Connect  to MongoDB", command=connect_to_mongodb)
 connect_button.pack()
 
-# TESTING PURPOSES
-add_column_to_collection("Titanic-V1", "Test", 1)
+# Sync button - picks up passengers appended to the CSV without reloading the collection
+sync_button = ttk.Button(window, text="Sync new rows", command=lambda: load_scheduler.submit(
+    backend.sync, data_synced, lambda e: console_output.insert(tk.END, f"Error syncing MongoDB: {e}\n"), keep=True))
+sync_button.pack()
+
+# Load the data and the heavy modules in the background once the window is showing
+window.after_idle(lambda: mark('window shown'))
+preload()
+render_scheduler.submit(load_data, data_loaded, lambda e: console_output.insert(tk.END, f"Error inserting data into MongoDB: {e}\n"), keep=True)
 
 # GUI render
 window.mainloop()
\ No newline at end of file
@@ -0,0 +1,499 @@
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from pymongo import DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure
+from titanic_data import DROPPED_COLUMNS, KEY_COLUMN, csv_end_offset, read_csv_since, schema_dtypes
+from titanic_aggregate import KDE_BINS, bar_aggregates, bin_count, histogram_aggregates, kde_support, sampled_aggregates, smooth_binned
+from titanic_cube import count_frame, covers, cube_columns, cube_entries, cube_key, cube_signature
+from titanic_features import DERIVED_FEATURES, derive_features, derived_names, feature_inputs, feature_signature
+from titanic_filters import FILTER_OPS
+
+# MongoDB backend - compiles create_graph requests into aggregation pipelines
+# ($match/$project/$group/$bucket) so only the aggregated buckets come back
+# works the same against a real server or a mongomock collection
+
+# how many documents to look at when working out the field types
+SAMPLE_SIZE = 20
+
+# bulk loader settings - documents per insert_many, parallel loaders, attempts per batch
+LOAD_BATCH_SIZE = 10000
+LOAD_WORKERS = 4
+LOAD_RETRIES = 3
+
+# mongo error code for a duplicate _id
+DUPLICATE_KEY = 11000
+
+# collection (in the same database) recording how far into its CSV each collection is
+SYNC_COLLECTION = 'sync_state'
+# collection (in the same database) recording how far each collection's first load got - the rows every batch
+# up to the first unfinished one covers, and whether it finished
+LOAD_CHECKPOINT_COLLECTION = 'load_checkpoint'
+# collection (in the same database) recording which derived features are stored, and at which source version
+FEATURES_COLLECTION = 'derived_features'
+# collections (in the same database) holding the data cube (titanic_cube), and what each collection's cube is up to
+CUBE_COLLECTION = 'cube_counts'
+CUBE_STATE_COLLECTION = 'cube_state'
+
+def is_missing(value):
+    # pandas stores missing values as NaN floats, not null
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+def get_collection_columns(collection):
+    # field names, and a non-missing sample value for each, from the first few documents
+    columns = {}
+    for document in collection.find({}, {'_id': 0}).limit(SAMPLE_SIZE):
+        for field, value in document.items():
+            if is_missing(columns.get(field)):
+                columns[field] = value
+    return columns
+
+def is_numeric_column(columns, column_name):
+    value = columns[column_name]
+    return isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool)
+
+def present(columns, column_name):
+    # filter that drops null, missing and NaN values for this field
+    # NaN sorts below every number so a >= -inf range skips it
+    if is_numeric_column(columns, column_name):
+        return {'$gte': float('-inf')}
+    if isinstance(columns[column_name], str):
+        return {'$type': 'string'}
+    return {'$ne': None}
+
+def check_feature(columns, feature):
+    if feature not in columns:
+        raise ValueError(f"Unknown field '{feature}'")
+    return feature
+
+def cleaned_match(columns, filters=()):
+    # keep the same documents clean_data does - ignore Cabin, drop any with a missing value
+    # then narrow down by the GUI's filters ($and, since a filter can be on a field the clean check also uses)
+    kept = [column for column in columns if column not in DROPPED_COLUMNS]
+    match = {column: present(columns, column) for column in kept}
+    if filters:
+        conditions = [{check_feature(columns, column): {FILTER_OPS[op][2]: value}} for column, op, value in filters]
+        match = {'$and': [match] + conditions}
+    return {'$match': match}
+
+def project(*features):
+    # only carry the fields the plot needs through the rest of the pipeline
+    return {'$project': dict({feature: 1 for feature in features}, _id=0)}
+
+def plan_count_pipeline(columns, first_feature, second_feature=None, filters=()):
+    features = [check_feature(columns, first_feature)]
+    if second_feature:
+        features.append(check_feature(columns, second_feature))
+    return [
+        cleaned_match(columns, filters),
+        project(*features),
+        {'$group': {'_id': {feature: f'${feature}' for feature in features}, 'count': {'$sum': 1}}},
+    ]
+
+def plan_stats_pipeline(columns, feature, filters=()):
+    check_feature(columns, feature)
+    return [
+        cleaned_match(columns, filters),
+        project(feature),
+        {'$group': {
+            '_id': None,
+            'n': {'$sum': 1},
+            'low': {'$min': f'${feature}'},
+            'high': {'$max': f'${feature}'},
+            'mean': {'$avg': f'${feature}'},
+            'mean_sq': {'$avg': {'$multiply': [f'${feature}', f'${feature}']}},
+        }},
+    ]
+
+def plan_bucket_pipeline(columns, feature, edges, filters=()):
+    # $bucket bins are [lower, upper) so the top edge goes to the 'default' bucket
+    check_feature(columns, feature)
+    return [
+        cleaned_match(columns, filters),
+        project(feature),
+        {'$bucket': {
+            'groupBy': f'${feature}',
+            'boundaries': [float(edge) for edge in edges],
+            'default': 'top',
+            'output': {'count': {'$sum': 1}},
+        }},
+    ]
+
+def query_counts(collection, columns, first_feature, second_feature=None, filters=()):
+    # unfiltered counts of the cube fields are already worked out - a lookup in cube_counts
+    counts = None if filters else cube_counts(collection, columns, first_feature, second_feature)
+    if counts is not None:
+        return counts
+    rows = [dict(row['_id'], count=row['count'])
+            for row in collection.aggregate(plan_count_pipeline(columns, first_feature, second_feature, filters))]
+    if not second_feature:
+        counts = pd.DataFrame(rows, columns=[first_feature, 'count'])
+        return counts.set_index(first_feature).sort_index()
+
+    counts = pd.DataFrame(rows, columns=[first_feature, second_feature, 'count'])
+    counts = counts.pivot(index=first_feature, columns=second_feature, values='count')
+    return counts.fillna(0).astype(int).sort_index()
+
+def query_buckets(collection, columns, feature, low, high, bins, filters=()):
+    edges = np.linspace(low, high, bins + 1)
+    counts = np.zeros(bins, dtype=np.int64)
+    positions = {float(edge): i for i, edge in enumerate(edges[:-1])}
+    for row in collection.aggregate(plan_bucket_pipeline(columns, feature, edges, filters)):
+        if row['_id'] == 'top':
+            counts[-1] += row['count']
+        else:
+            counts[positions[row['_id']]] += row['count']
+    return counts, edges
+
+def query_histogram(collection, columns, feature, selected_bins, filters=()):
+    stats = next(iter(collection.aggregate(plan_stats_pipeline(columns, feature, filters))), None)
+    if stats is None:
+        bins = bin_count(selected_bins, 0)
+        return histogram_aggregates(feature, np.zeros(bins, dtype=np.int64), np.linspace(0, 1, bins + 1), None, None)
+
+    n, low, high = stats['n'], stats['low'], stats['high']
+    bins = bin_count(selected_bins, n)
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    counts, edges = query_buckets(collection, columns, feature, low, high, bins, filters)
+
+    # KDE from a fine bucketed histogram, smoothed on our side
+    kde_x, kde_y = None, None
+    variance = (stats['mean_sq'] - stats['mean'] ** 2) * n / (n - 1) if n > 1 else 0
+    if variance > 0:
+        bandwidth, kde_low, kde_high = kde_support(n, math.sqrt(variance), low, high)
+        binned, kde_edges = query_buckets(collection, columns, feature, kde_low, kde_high, KDE_BINS, filters)
+        kde_x, kde_y = smooth_binned(binned, kde_edges, n, bandwidth)
+
+    return histogram_aggregates(feature, counts, edges, kde_x, kde_y)
+
+def complete_keys(collection, keys, key=KEY_COLUMN):
+    # which of these documents the cleaned pipelines keep - fields added since the CSV was read (add_column) count too
+    match = cleaned_match(get_collection_columns(collection))['$match']
+    documents = collection.find({'$and': [match, {key: {'$in': [int(value) for value in keys]}}]}, {key: 1, '_id': 0})
+    return [document[key] for document in documents]
+
+def query_sample(collection, columns, features, sample, filters=()):
+    # $sample first - on a real server that's a random cursor, it doesn't read the whole collection
+    # returns the cleaned, filtered sampled documents and the scale (documents per sampled one), or None if it isn't worth sampling
+    total = collection.estimated_document_count()
+    if sample >= total:
+        return None
+    features = [check_feature(columns, feature) for feature in dict.fromkeys(features)]
+    pipeline = [{'$sample': {'size': sample}}, cleaned_match(columns, filters), project(*features)]
+    rows = pd.DataFrame(list(collection.aggregate(pipeline)), columns=features)
+    # the same compact types the CSV path loads with
+    return rows.astype(schema_dtypes(rows)), total / sample
+
+def aggregate_graph_data_mongo(collection, selected_graph_type, selected_first_feature, selected_second_feature, selected_bins, filters=(), sample=0):
+    columns = get_collection_columns(collection)
+
+    if sample and sample > 0:
+        features = [selected_first_feature] + ([selected_second_feature] if selected_second_feature else [])
+        sampled = query_sample(collection, columns, features, sample, filters)
+        if sampled is not None:
+            # only the sampled documents come back, aggregate them on our side
+            return sampled_aggregates(selected_graph_type, selected_first_feature, selected_second_feature, sampled[0], selected_bins, sampled[1])
+
+    if selected_graph_type == 'Bar Plot':
+        counts = query_counts(collection, columns, selected_first_feature, selected_second_feature, filters)
+        return bar_aggregates('Bar Plot', selected_first_feature, selected_second_feature, counts)
+
+    if selected_graph_type == 'Histogram':
+        check_feature(columns, selected_first_feature)
+        # text fields can't be bucketed, count each value instead
+        if not is_numeric_column(columns, selected_first_feature):
+            counts = query_counts(collection, columns, selected_first_feature, None, filters)
+            return bar_aggregates('Histogram', selected_first_feature, None, counts)
+        return query_histogram(collection, columns, selected_first_feature, selected_bins, filters)
+
+    return {'graph_type': selected_graph_type}
+
+def chunk_to_documents(chunk):
+    # NaN -> None so missing values are stored as null instead of a NaN double
+    # object dtype gives plain Python ints/floats that BSON can encode
+    return chunk.astype(object).where(chunk.notna(), None).to_dict('records')
+
+def insert_batch(collection, documents, retries=LOAD_RETRIES):
+    for attempt in range(1, retries + 1):
+        try:
+            collection.insert_many(documents, ordered=False)
+            return len(documents)
+        except BulkWriteError as e:
+            # insert_many sets _id on our dicts, so a retry re-sends the same ids
+            # duplicates just mean an earlier attempt already got those documents in
+            errors = e.details.get('writeErrors', [])
+            if errors and all(error['code'] == DUPLICATE_KEY for error in errors):
+                return len(documents)
+            raise
+        except ConnectionFailure:
+            if attempt == retries:
+                raise
+            # back off a little before trying the batch again
+            time.sleep(0.5 * attempt)
+
+def print_progress(documents_loaded, documents_per_second):
+    print(f'Loaded {documents_loaded} documents ({documents_per_second:.0f} docs/s)')
+
+def get_load_checkpoint(collection):
+    return collection.database[LOAD_CHECKPOINT_COLLECTION].find_one({'_id': collection.name})
+
+def save_load_checkpoint(collection, source, rows_loaded, complete):
+    checkpoint = {'source': source, 'rows_loaded': rows_loaded, 'complete': complete}
+    collection.database[LOAD_CHECKPOINT_COLLECTION].replace_one({'_id': collection.name}, checkpoint, upsert=True)
+
+def needs_load(collection):
+    # empty collection, or a parallel load that was interrupted part way
+    # collections loaded before checkpoints existed have no checkpoint and count as done
+    if collection.count_documents({}, limit=1) == 0:
+        return True
+    checkpoint = get_load_checkpoint(collection)
+    return checkpoint is not None and not checkpoint['complete']
+
+def load_csv(collection, csv_path, batch_size=LOAD_BATCH_SIZE, workers=LOAD_WORKERS, retries=LOAD_RETRIES, progress=print_progress):
+    source = os.path.abspath(csv_path)
+    # an empty collection starts again from the top, whatever an old checkpoint says
+    checkpoint = get_load_checkpoint(collection) if collection.count_documents({}, limit=1) else None
+    if checkpoint is not None and checkpoint['source'] != source:
+        raise ValueError(f"'{collection.name}' was loaded from {checkpoint['source']}, not {source}")
+    if checkpoint is not None and checkpoint['complete']:
+        return {'documents': 0, 'batches': 0, 'seconds': 0.0, 'documents_per_second': 0.0}
+    rows_done = checkpoint['rows_loaded'] if checkpoint is not None else 0
+    # marked unfinished before anything goes in, so a load that dies part way is picked up again by needs_load
+    save_load_checkpoint(collection, source, rows_done, False)
+
+    # at most this many batches read but not yet written - stops the reader racing ahead
+    pending = threading.BoundedSemaphore(workers * 2)
+    lock = threading.Lock()
+    loaded = {'documents': 0, 'batches': 0}
+    # batches finish out of order - the checkpoint only moves past a batch once every batch before it is in too
+    finished = {}
+    done = {'batches': 0, 'rows': rows_done}
+    start = time.perf_counter()
+    create_key_index(collection)
+    # rows past this point are left for sync_csv
+    end_offset = csv_end_offset(csv_path)
+
+    def load(index, documents):
+        try:
+            count = insert_batch(collection, documents, retries)
+        finally:
+            pending.release()
+        with lock:
+            loaded['documents'] += count
+            loaded['batches'] += 1
+            finished[index] = len(documents)
+            if done['batches'] in finished:
+                while done['batches'] in finished:
+                    done['rows'] += finished.pop(done['batches'])
+                    done['batches'] += 1
+                save_load_checkpoint(collection, source, done['rows'], False)
+            if progress is not None:
+                progress(loaded['documents'], loaded['documents'] / (time.perf_counter() - start))
+
+    futures = []
+    # skip the rows a previous (interrupted) load already got in, keep the header
+    # batches past those may be partly in too - insert_batch takes the duplicates as done
+    chunks = pd.read_csv(csv_path, chunksize=batch_size, skiprows=range(1, rows_done + 1))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for index, chunk in enumerate(chunks):
+            pending.acquire()
+            futures.append(executor.submit(load, index, chunk_to_documents(chunk)))
+    # surface the first failed batch, if any
+    for future in futures:
+        future.result()
+    save_sync_state(collection, csv_path, end_offset)
+    save_load_checkpoint(collection, source, done['rows'], True)
+
+    seconds = time.perf_counter() - start
+    return dict(loaded, seconds=seconds, documents_per_second=loaded['documents'] / seconds if seconds else 0.0)
+
+def create_key_index(collection, key=KEY_COLUMN):
+    # unique index so documents can be upserted on the passenger id
+    collection.create_index(key, unique=True)
+
+def get_high_water(collection, key=KEY_COLUMN):
+    document = collection.find_one({key: {'$ne': None}}, {key: 1}, sort=[(key, DESCENDING)])
+    return document[key] if document is not None else None
+
+def get_sync_state(collection):
+    return collection.database[SYNC_COLLECTION].find_one({'_id': collection.name})
+
+def save_sync_state(collection, csv_path, byte_offset, key=KEY_COLUMN):
+    state = {'source': os.path.abspath(csv_path), 'byte_offset': byte_offset, 'high_water': get_high_water(collection, key)}
+    collection.database[SYNC_COLLECTION].replace_one({'_id': collection.name}, state, upsert=True)
+
+def upsert_documents(collection, documents, key=KEY_COLUMN, retries=LOAD_RETRIES):
+    # insert new passengers, overwrite the fields of the ones that are already there
+    # fields added later (add_column_to_collection) are left alone
+    requests = [UpdateOne({key: document[key]}, {'$set': document}, upsert=True) for document in documents]
+    for attempt in range(1, retries + 1):
+        try:
+            collection.bulk_write(requests, ordered=False)
+            return len(documents)
+        except ConnectionFailure:
+            # upserts are safe to send again
+            if attempt == retries:
+                raise
+            time.sleep(0.5 * attempt)
+
+def read_missing_rows(collection, csv_path, key=KEY_COLUMN, batch_size=LOAD_BATCH_SIZE):
+    # no offset recorded (loaded before syncing existed) - the high-water mark can't be trusted, unordered
+    # insert_many batches can leave gaps below it, so every passenger id is looked up and the rows not in yet are kept
+    chunks = []
+    for chunk in pd.read_csv(csv_path, chunksize=batch_size):
+        ids = [int(value) for value in chunk[key].dropna()]
+        present = {document[key] for document in collection.find({key: {'$in': ids}}, {key: 1, '_id': 0})}
+        chunks.append(chunk[~chunk[key].isin(present)])
+    return pd.concat(chunks, ignore_index=True)
+
+def sync_csv(collection, csv_path, key=KEY_COLUMN, batch_size=LOAD_BATCH_SIZE, retries=LOAD_RETRIES):
+    # bring an already loaded collection up to date with rows appended to the CSV since,
+    # reading only the new bytes - documents are upserted on the passenger id so syncing twice is harmless
+    source = os.path.abspath(csv_path)
+    end_offset = csv_end_offset(csv_path)
+    state = get_sync_state(collection)
+    high_water = get_high_water(collection, key)
+
+    start = time.perf_counter()
+    create_key_index(collection, key)
+    if state is not None and state['source'] == source and state['byte_offset'] <= end_offset:
+        new_rows, end_offset = read_csv_since(csv_path, state['byte_offset'], end_offset)
+    else:
+        # first sync, a different file, or the file was rewritten shorter
+        new_rows = read_missing_rows(collection, csv_path, key, batch_size)
+
+    for batch_start in range(0, len(new_rows), batch_size):
+        upsert_documents(collection, chunk_to_documents(new_rows.iloc[batch_start:batch_start + batch_size]), key, retries)
+    # only move the offset on once the rows are in
+    save_sync_state(collection, csv_path, end_offset, key)
+
+    # rows at or below the old high-water mark may have replaced existing passengers
+    appended_only = high_water is None or bool((new_rows[key] > high_water).all())
+    seconds = time.perf_counter() - start
+    return {'rows': len(new_rows), 'new_rows': new_rows, 'appended_only': appended_only, 'seconds': seconds}
+
+def source_version(collection, key=KEY_COLUMN):
+    # where the collection's data is up to - loads and syncs are the only writers, and both move this on
+    state = get_sync_state(collection)
+    if state is not None:
+        return f"{state['byte_offset']}:{state['high_water']}"
+    return f'high_water:{get_high_water(collection, key)}'
+
+def fresh_features(collection, key=KEY_COLUMN):
+    # derived features stored with their current definition at the current source version
+    version = source_version(collection, key)
+    stored = collection.database[FEATURES_COLLECTION].find({'collection': collection.name})
+    return [document['feature'] for document in stored if document['feature'] in DERIVED_FEATURES
+            and (document['signature'], document['source_version']) == (feature_signature(document['feature']), version)]
+
+def stale_features(collection, key=KEY_COLUMN):
+    # derived features that are missing, were stored with an old definition, or from older data
+    columns = [column for column in get_collection_columns(collection) if column not in DERIVED_FEATURES]
+    fresh = fresh_features(collection, key)
+    return [name for name in derived_names(columns) if name not in fresh]
+
+def store_features(collection, names, key=KEY_COLUMN, keys=None, batch_size=LOAD_BATCH_SIZE, retries=LOAD_RETRIES):
+    # work out derived features from their input fields and $set them in bulk -
+    # every document, or just the ones with these passenger ids (e.g. the ones a sync brought in)
+    start = time.perf_counter()
+    query = {key: {'$in': [int(value) for value in keys]}} if keys is not None else {}
+    cursor = collection.find(query, dict({column: 1 for column in feature_inputs(names)}, _id=1)).batch_size(batch_size)
+    documents = 0
+    batch = []
+    for document in cursor:
+        batch.append(document)
+        if len(batch) == batch_size:
+            documents += set_features(collection, batch, names, retries)
+            batch = []
+    if batch:
+        documents += set_features(collection, batch, names, retries)
+
+    version = source_version(collection, key)
+    for name in names:
+        collection.database[FEATURES_COLLECTION].replace_one(
+            {'_id': f'{collection.name}.{name}'},
+            {'collection': collection.name, 'feature': name, 'signature': feature_signature(name), 'source_version': version},
+            upsert=True)
+    return {'features': list(names), 'documents': documents, 'seconds': time.perf_counter() - start}
+
+def set_features(collection, documents, names, retries=LOAD_RETRIES):
+    # one batch - the features for every document at once, then one unordered bulk write
+    chunk = pd.DataFrame(documents)
+    derived = derive_features(chunk, names)
+    requests = [UpdateOne({'_id': _id}, {'$set': values}) for _id, values in zip(chunk['_id'], chunk_to_documents(derived))]
+    for attempt in range(1, retries + 1):
+        try:
+            collection.bulk_write(requests, ordered=False)
+            return len(requests)
+        except ConnectionFailure:
+            # setting the same values again is harmless
+            if attempt == retries:
+                raise
+            time.sleep(0.5 * attempt)
+
+def cube_fresh(collection, key=KEY_COLUMN, columns=None):
+    # the cube was worked out over these fields, up to the current source version
+    state = collection.database[CUBE_STATE_COLLECTION].find_one({'_id': collection.name})
+    if state is None:
+        return False
+    if columns is None:
+        columns = get_collection_columns(collection)
+    return (state['signature'], state['source_version']) == (cube_signature(columns), source_version(collection, key))
+
+def cube_counts(collection, columns, first_feature, second_feature=None, key=KEY_COLUMN):
+    # count table from the cube - None if it doesn't cover these fields or is out of date
+    features = [first_feature] + ([second_feature] if second_feature else [])
+    if not covers(first_feature, second_feature) or any(feature not in columns for feature in features):
+        return None
+    if not cube_fresh(collection, key, columns):
+        return None
+    first, second = cube_key(first_feature, second_feature)
+    stored = collection.database[CUBE_COLLECTION].find(
+        {'_id.collection': collection.name, '_id.first_feature': first, '_id.second_feature': second})
+    rows = [(document['_id']['first_value'], document['_id']['second_value'], document['count']) for document in stored]
+    return count_frame(rows, first_feature, second_feature)
+
+def plan_cells_pipeline(columns, key=KEY_COLUMN, keys=None):
+    # base cells of the cube - cleaned documents counted per combination of the cube fields, in one $group
+    features = cube_columns(columns)
+    pipeline = [cleaned_match(columns), project(*features),
+                {'$group': {'_id': {feature: f'${feature}' for feature in features}, 'count': {'$sum': 1}}}]
+    if keys is not None:
+        pipeline.insert(0, {'$match': {key: {'$in': [int(value) for value in keys]}}})
+    return pipeline
+
+def query_cells(collection, columns, key=KEY_COLUMN, keys=None):
+    features = cube_columns(columns)
+    if not features:
+        return pd.DataFrame(columns=['count'])
+    rows = [dict(row['_id'], count=row['count']) for row in collection.aggregate(plan_cells_pipeline(columns, key, keys))]
+    return pd.DataFrame(rows, columns=features + ['count'])
+
+def store_cube(collection, key=KEY_COLUMN, keys=None):
+    # work the cube out from every cleaned document, or $inc on the counts of just the documents with these passenger ids
+    # (only right if they're new documents - replaced ones would be counted twice)
+    start = time.perf_counter()
+    cube = collection.database[CUBE_COLLECTION]
+    states = collection.database[CUBE_STATE_COLLECTION]
+    columns = get_collection_columns(collection)
+    cells = query_cells(collection, columns, key, keys)
+    if keys is None:
+        # lookups fall back to querying the collection until the new cube is in
+        states.delete_one({'_id': collection.name})
+        cube.delete_many({'_id.collection': collection.name})
+    requests = [UpdateOne({'_id': {'collection': collection.name, 'first_feature': first, 'second_feature': second,
+                                   'first_value': first_value, 'second_value': second_value}},
+                          {'$inc': {'count': count}}, upsert=True)
+                for first, second, first_value, second_value, count in cube_entries(cells)]
+    # $inc isn't safe to send again, so no retries - if this fails the state is left behind the source version
+    # (a sync has moved it on, a rebuild removed it) and the next refresh_cube starts the cube again
+    if requests:
+        cube.bulk_write(requests, ordered=False)
+    states.replace_one({'_id': collection.name},
+                       {'signature': cube_signature(columns), 'source_version': source_version(collection, key)}, upsert=True)
+    return {'cells': len(cells), 'seconds': time.perf_counter() - start}
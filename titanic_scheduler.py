@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor
+
+# render scheduler for the GUIs - runs the data/aggregation work for a graph
+# on a background thread so the Tk mainloop keeps handling events
+# the result is handed back on the Tk thread (window.after), where it's drawn
+
+# how often (in ms) the Tk thread checks whether the running render has finished
+POLL_MS = 20
+
+class RenderScheduler:
+    def __init__(self, window, poll_ms=POLL_MS):
+        self.window = window
+        self.poll_ms = poll_ms
+        # a single worker - renders run one at a time
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.running = None
+        self.queued = None
+        # work that has to run and hand its result back whatever gets clicked meanwhile (e.g. loading the data)
+        self.kept = []
+
+    def submit(self, work, on_done, on_error=None, keep=False):
+        # work() runs on the worker thread, on_done(result) / on_error(e) run on the Tk thread
+        # keep=True work is never replaced or thrown away by newer clicks
+        request = (work, on_done, on_error, keep)
+        if self.running is None:
+            self.start(request)
+        elif keep:
+            self.kept.append(request)
+        else:
+            # a render is already going - fold this click into the next render,
+            # replacing any click that was already waiting
+            self.queued = request
+
+    def submit_progressive(self, works, on_done, on_error=None):
+        # run works one after the other, drawing each result - e.g. a quick preview, then the exact graph
+        # a work can return None to skip drawing; a newer click drops the steps that haven't run yet
+        work, rest = works[0], works[1:]
+
+        def done(result):
+            if result is not None:
+                on_done(result)
+            if rest:
+                self.submit_progressive(rest, on_done, on_error)
+
+        self.submit(work, done, on_error)
+
+    def start(self, request):
+        work, on_done, on_error, keep = request
+        self.running = (self.executor.submit(work), on_done, on_error, keep)
+        self.window.after(self.poll_ms, self.poll)
+
+    def poll(self):
+        future, on_done, on_error, keep = self.running
+        if not future.done():
+            self.window.after(self.poll_ms, self.poll)
+            return
+
+        self.running = None
+        if self.queued is not None and not keep:
+            # the user has asked for something newer, don't bother drawing this one (errors are still reported)
+            on_done = None
+        # hand this one's result back first, then start whatever is waiting
+        self.deliver(future, on_done, on_error)
+        if self.running is None:
+            self.start_next()
+
+    def deliver(self, future, on_done, on_error):
+        if future.cancelled():
+            return
+        try:
+            result = future.result()
+        except Exception as e:
+            if on_error is None:
+                raise
+            on_error(e)
+            return
+        if on_done is not None:
+            on_done(result)
+
+    def start_next(self):
+        if self.kept:
+            self.start(self.kept.pop(0))
+        elif self.queued is not None:
+            request, self.queued = self.queued, None
+            self.start(request)
+
+    def cancel(self):
+        # drop any waiting click and make sure the running render's result isn't drawn
+        # (kept work carries on as normal)
+        self.queued = None
+        if self.running is not None and not self.running[3]:
+            future, _, on_error, keep = self.running
+            future.cancel()
+            self.running = (future, None, on_error, keep)
+
+    def is_busy(self):
+        return self.running is not None
+
+    def shutdown(self):
+        self.queued = None
+        self.kept = []
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,286 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+import titanic_data
+from titanic_aggregate import aggregates_to_json, get_cached_aggregates, get_render_cache_stats, render_cache_key
+from titanic_backends import CSVBackend, MemoryBackend, MongoBackend, SQLiteBackend
+from titanic_trace import PerfMonitor, tracing
+
+# shared plot/aggregation server - one process holds the data and the render cache, and every analyst's
+# GUI asks it for graphs (run them with --server, see titanic_backends.ServerBackend) instead of each
+# loading its own copy of the table and aggregating it all over again
+# plain HTTP, over TCP or a unix socket (--socket), handled on one asyncio loop; the aggregation and
+# drawing run on a thread pool through the usual backend interface (by default MemoryBackend - the table
+# and its cleaned copy held once in memory)
+#   GET  /columns                 - feature names for the dropdowns
+#   GET  /aggregate?type=&first=&second=&bins=&filters=&sample=  - aggregated plot data as JSON
+#                                   (filters is a JSON list of [column, op, value], as titanic_filters parses them)
+#   GET  /preview?...             - sampled estimate of the same, null when the table is small
+#   GET  /graph.png?...&palette=&dpi=  - the graph drawn as a PNG
+#   POST /sync                    - pick up rows appended to the CSV
+#   POST /add_column              - {"name": ..., "default": ...}
+#   GET  /stats                   - rows, data version, render cache, cleaned frame cache and request counts
+# requests for something that's already being worked out wait for that result instead of starting again,
+# so a hundred clients asking for the same graph cost one aggregation
+
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8765
+# threads aggregating and drawing at once
+SERVER_WORKERS = 8
+# rendered PNGs kept, least recently used dropped first (the data version is in the key, so they never go stale)
+PNG_CACHE_ENTRIES = 128
+# figure size of the PNGs, the same as the GUI canvas
+PNG_FIGSIZE = (8, 6)
+PNG_DPI = 100
+
+class RequestError(Exception):
+    # bad request from a client - sent back as a 400
+    pass
+
+def graph_request(query):
+    # (graph type, first feature, second feature, bins, filters, sample) from the query string
+    params = {name: values[-1] for name, values in parse_qs(query).items()}
+    if 'type' not in params or 'first' not in params:
+        raise RequestError('type and first are required')
+    try:
+        bins = int(params.get('bins') or 0)
+        sample = int(params.get('sample') or 0)
+        filters = tuple(tuple(condition) for condition in json.loads(params.get('filters') or '[]'))
+    except (ValueError, TypeError) as e:
+        raise RequestError(f'Bad bins, sample or filters: {e}')
+    return (params['type'], params['first'], params.get('second') or '', bins, filters, sample), params
+
+def json_body(value):
+    return 'application/json', json.dumps(value).encode()
+
+class PlotServer:
+    def __init__(self, backend, workers=SERVER_WORKERS, report=print, png_entries=PNG_CACHE_ENTRIES):
+        self.backend = backend
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        # renders computed here are timed and reported the same way the GUIs do it
+        self.monitor = PerfMonitor(report)
+        # key -> future of the request being worked out, on the loop thread only
+        self.inflight = {}
+        self.png_cache = OrderedDict()
+        self.png_entries = png_entries
+        # seaborn's palette is global and pyplot isn't thread safe - one drawing at a time
+        self.draw_lock = threading.Lock()
+        self.stats = {'requests': 0, 'merged': 0, 'errors': 0}
+
+    async def shared(self, key, work):
+        # run work on the pool, once per key at a time - requests for the same key meanwhile get the same result
+        # (shielded, so a client hanging up doesn't cancel it for the others)
+        future = self.inflight.get(key)
+        if future is not None:
+            self.stats['merged'] += 1
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().run_in_executor(self.executor, work)
+        self.inflight[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self.inflight.get(key) is future:
+                del self.inflight[key]
+
+    def aggregates(self, key, request):
+        # from the render cache, or worked out (and cached) by the backend
+        aggregates = get_cached_aggregates(key)
+        if aggregates is not None:
+            return aggregates
+        label = ' '.join(part for part in request[:3] if part)
+        trace = self.monitor.start(label)
+        with tracing(trace):
+            aggregates = self.backend.render(key, *request)
+        trace.finish()
+        return aggregates
+
+    def preview(self, request):
+        trace = self.monitor.start(' '.join(part for part in request[:3] if part) + ' (preview)')
+        with tracing(trace):
+            aggregates = self.backend.preview(*request[:5])
+        if aggregates is not None:
+            trace.finish()
+        return aggregates
+
+    def draw_png(self, aggregates, palette, dpi):
+        from matplotlib.figure import Figure
+        from titanic_graph import draw_graph
+        figure = Figure(figsize=PNG_FIGSIZE)
+        buffer = io.BytesIO()
+        with self.draw_lock:
+            draw_graph(aggregates, palette, figure.add_subplot())
+            figure.savefig(buffer, format='png', dpi=dpi)
+        return buffer.getvalue()
+
+    async def respond(self, method, target, body):
+        # (status, content type, payload) for one request
+        url = urlsplit(target)
+        route = (method, url.path)
+        if route == ('GET', '/columns'):
+            return HTTPStatus.OK, *json_body(await self.shared(('columns',), self.backend.columns))
+
+        if route in [('GET', '/aggregate'), ('GET', '/preview'), ('GET', '/graph.png')]:
+            request, params = graph_request(url.query)
+            key = render_cache_key(*request)
+            if url.path == '/aggregate':
+                # encoded once, every merged request sends the same bytes
+                return HTTPStatus.OK, 'application/json', await self.shared(
+                    ('aggregate',) + key, lambda: json.dumps(aggregates_to_json(self.aggregates(key, request))).encode())
+            if url.path == '/preview':
+                return HTTPStatus.OK, 'application/json', await self.shared(
+                    ('preview',) + key, lambda: json.dumps(aggregates_to_json(self.preview(request))).encode())
+            palette = params.get('palette') or 'viridis'
+            try:
+                dpi = int(params.get('dpi') or PNG_DPI)
+            except ValueError:
+                raise RequestError('dpi must be an integer')
+            png_key = key + (palette, dpi)
+            png = self.png_cache.get(png_key)
+            if png is None:
+                png = await self.shared(('png',) + png_key, lambda: self.draw_png(self.aggregates(key, request), palette, dpi))
+                self.png_cache[png_key] = png
+                while len(self.png_cache) > self.png_entries:
+                    self.png_cache.popitem(last=False)
+            self.png_cache.move_to_end(png_key)
+            return HTTPStatus.OK, 'image/png', png
+
+        if route == ('POST', '/sync'):
+            if hasattr(self.backend, 'sync'):
+                stats = await self.shared(('sync',), self.backend.sync)
+            else:
+                # backends without a sync (CSV) notice a changed file themselves - load just checks its cache is current
+                await self.shared(('sync',), self.backend.load)
+                stats = {'rows': 0}
+            # the synced rows themselves stay here
+            return HTTPStatus.OK, *json_body(aggregates_to_json({name: value for name, value in stats.items() if name != 'new_rows'}))
+
+        if route == ('POST', '/add_column'):
+            try:
+                column = json.loads(body or b'{}')
+                name, default = column['name'], column.get('default')
+            except (ValueError, KeyError, TypeError):
+                raise RequestError('expected {"name": ..., "default": ...}')
+            if not hasattr(self.backend, 'add_column'):
+                raise RequestError(f"The {self.backend.name} backend can't add columns")
+            added = await self.shared(('add_column', name), lambda: self.backend.add_column(name, default))
+            return HTTPStatus.OK, *json_body({'added': added})
+
+        if route == ('GET', '/stats'):
+            rows = await self.shared(('rows',), self.backend.row_estimate)
+            return HTTPStatus.OK, *json_body(dict(self.stats, rows=rows, version=titanic_data.data_version,
+                                                  inflight=len(self.inflight), png_cache=len(self.png_cache),
+                                                  render_cache=get_render_cache_stats(), clean_cache=titanic_data.get_cache_stats()))
+
+        return HTTPStatus.NOT_FOUND, *json_body({'error': f'No such endpoint: {method} {url.path}'})
+
+    async def handle(self, reader, writer):
+        # one client connection - HTTP/1.1, kept alive until the client closes it or asks to
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, _ = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length') or 0))
+
+                self.stats['requests'] += 1
+                try:
+                    status, content_type, payload = await self.respond(method, target, body)
+                except (RequestError, ValueError, KeyError) as e:
+                    # unknown columns, bad filters and the like - the client's mistake
+                    self.stats['errors'] += 1
+                    message = f'Unknown column {e}' if isinstance(e, KeyError) else str(e)
+                    status, (content_type, payload) = HTTPStatus.BAD_REQUEST, json_body({'error': message})
+                except Exception as e:
+                    self.stats['errors'] += 1
+                    status, (content_type, payload) = HTTPStatus.INTERNAL_SERVER_ERROR, json_body({'error': str(e)})
+
+                close = headers.get('connection', '').lower() == 'close'
+                head = (f'HTTP/1.1 {status.value} {status.phrase}\r\nContent-Type: {content_type}\r\n'
+                        f'Content-Length: {len(payload)}\r\n' + ('Connection: close\r\n' if close else '') + '\r\n')
+                writer.write(head.encode('latin-1') + payload)
+                await writer.drain()
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=SERVER_HOST, port=SERVER_PORT, socket_path=None, ready=None):
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            server = await asyncio.start_unix_server(self.handle, path=socket_path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        if ready is not None:
+            ready(server)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.backend.close()
+
+def make_backend(args):
+    if args.backend == 'sqlite':
+        return SQLiteBackend(args.sqlite, args.table, args.csv)
+    if args.backend == 'mongo':
+        return MongoBackend(args.mongo_uri, args.db, args.collection, args.csv)
+    if args.backend == 'csv':
+        return CSVBackend(args.csv)
+    return MemoryBackend(args.csv)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve Titanic graphs and aggregates to many clients from one copy of the data')
+    parser.add_argument('--backend', choices=['memory', 'csv', 'sqlite', 'mongo'], default='memory',
+                        help='where the data is held (memory - loaded once into this process)')
+    parser.add_argument('--csv', default='train.csv')
+    parser.add_argument('--sqlite', default='titanic.db', help='database file for --backend sqlite')
+    parser.add_argument('--table', default='titanic_data')
+    parser.add_argument('--mongo-uri', help='server for --backend mongo')
+    parser.add_argument('--db', default='Titanic-Data')
+    parser.add_argument('--collection', default='Titanic-V1')
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--socket', help='listen on this unix socket instead (clients use --server unix:<path>)')
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS, help='threads aggregating and drawing at once')
+    parser.add_argument('--quiet', action='store_true', help="don't report each render's timings")
+    args = parser.parse_args(argv)
+
+    import matplotlib
+    # PNGs only, no windows
+    matplotlib.use('Agg')
+    backend = make_backend(args)
+    stats = backend.load()
+    if isinstance(stats, dict):
+        print(f"Loaded {stats.get('rows', stats.get('documents'))} rows into the {backend.name} backend")
+    server = PlotServer(backend, args.workers, (lambda text: None) if args.quiet else print)
+    where = f'unix:{args.socket}' if args.socket else f'http://{args.host}:{args.port}'
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.socket, lambda _: print(f'Serving on {where}')))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,623 @@
+import json
+import math
+import os
+import random
+import time
+import numpy as np
+import pandas as pd
+from titanic_data import DROPPED_COLUMNS, KEY_COLUMN, PASSENGER_SCHEMA, csv_end_offset, read_csv_since, schema_dtypes
+from titanic_aggregate import KDE_BINS, bar_aggregates, bin_count, histogram_aggregates, kde_support, sampled_aggregates, smooth_binned
+from titanic_cube import count_frame, covers, cube_columns, cube_entries, cube_key, cube_signature
+from titanic_features import DERIVED_FEATURES, derive_features, derived_names, feature_inputs, feature_signature
+from titanic_filters import FILTER_OPS
+
+# SQLite backend - turns create_graph requests into grouped SQL so SQLite
+# does the aggregation and only a handful of rows come back into Python
+
+TABLE_NAME = 'titanic_data'
+
+# rows per transaction when streaming a CSV into SQLite
+INGEST_CHUNK_SIZE = 50000
+
+# declared column types SQLite gives numeric affinity to
+NUMERIC_TYPES = ('INT', 'REAL', 'FLOA', 'DOUB', 'NUMERIC', 'DECIMAL')
+
+# 1 when a row has no missing values (the rows clean_data keeps), kept up to date by triggers
+# it leads the covering indexes, so cleaned grouped counts never have to touch the table
+CLEAN_FLAG = 'complete_row'
+
+# columns the GUI groups by - each gets a covering index led by the flag
+GROUP_COLUMNS = ['Pclass', 'Sex', 'Survived', 'Embarked']
+
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def get_table_columns(conn, table_name=TABLE_NAME):
+    # PRAGMA returns a tuple - 1 = name of column, 2 = type of data
+    rows = conn.execute(f"PRAGMA table_info({quote_identifier(table_name)})").fetchall()
+    return {row[1]: row[2] for row in rows}
+
+def is_numeric_column(columns, column_name):
+    declared_type = (columns[column_name] or '').upper()
+    return any(numeric_type in declared_type for numeric_type in NUMERIC_TYPES)
+
+def complete_condition(columns):
+    # keep the same rows clean_data does - ignore Cabin, drop rows with any missing value
+    kept = [column for column in columns if column not in DROPPED_COLUMNS and column != CLEAN_FLAG]
+    return ' AND '.join(f'{quote_identifier(column)} IS NOT NULL' for column in kept) or '1'
+
+def cleaned_where(columns):
+    # tables with the managed schema carry the answer in a column
+    if CLEAN_FLAG in columns:
+        return f'{quote_identifier(CLEAN_FLAG)} = 1'
+    return complete_condition(columns)
+
+def check_feature(columns, feature):
+    if feature not in columns or feature == CLEAN_FLAG:
+        raise ValueError(f"Unknown column '{feature}'")
+    return quote_identifier(feature)
+
+def where_clause(columns, filters=()):
+    # cleaned rows, narrowed down by the GUI's filters
+    terms = [cleaned_where(columns)]
+    for column, op, value in filters:
+        terms.append(f'{check_feature(columns, column)} {FILTER_OPS[op][1]} {quote_literal(value)}')
+    return ' AND '.join(terms)
+
+def plan_count_query(columns, first_feature, second_feature=None, table_name=TABLE_NAME, filters=()):
+    group_by = [check_feature(columns, first_feature)]
+    if second_feature:
+        group_by.append(check_feature(columns, second_feature))
+    group_by = ', '.join(group_by)
+    return (f'SELECT {group_by}, COUNT(*) FROM {quote_identifier(table_name)} '
+            f'WHERE {where_clause(columns, filters)} GROUP BY {group_by} ORDER BY {group_by}')
+
+def plan_stats_query(columns, feature, table_name=TABLE_NAME, filters=()):
+    x = check_feature(columns, feature)
+    return (f'SELECT COUNT({x}), MIN({x}), MAX({x}), AVG({x}), AVG({x} * {x}) '
+            f'FROM {quote_identifier(table_name)} WHERE {where_clause(columns, filters)}')
+
+def plan_bucket_query(columns, feature, table_name=TABLE_NAME, filters=()):
+    # params are (low edge, bin width, last bin index) - values on the top edge go in the last bin
+    x = check_feature(columns, feature)
+    return (f'SELECT MIN(CAST(({x} - ?) / ? AS INTEGER), ?) AS bucket, COUNT(*) '
+            f'FROM {quote_identifier(table_name)} WHERE {where_clause(columns, filters)} GROUP BY bucket')
+
+def query_counts(conn, columns, first_feature, second_feature=None, table_name=TABLE_NAME, filters=()):
+    # unfiltered counts of the cube columns are already worked out - a lookup in cube_counts
+    counts = None if filters else cube_counts(conn, columns, first_feature, second_feature, table_name)
+    if counts is not None:
+        return counts
+    rows = conn.execute(plan_count_query(columns, first_feature, second_feature, table_name, filters)).fetchall()
+    if not second_feature:
+        counts = pd.DataFrame(rows, columns=[first_feature, 'count']).set_index(first_feature)
+        return counts
+
+    counts = pd.DataFrame(rows, columns=[first_feature, second_feature, 'count'])
+    counts = counts.pivot(index=first_feature, columns=second_feature, values='count')
+    return counts.fillna(0).astype(int).sort_index()
+
+def query_buckets(conn, columns, feature, low, high, bins, table_name=TABLE_NAME, filters=()):
+    width = (high - low) / bins
+    rows = conn.execute(plan_bucket_query(columns, feature, table_name, filters), (low, width, bins - 1)).fetchall()
+    counts = np.zeros(bins, dtype=np.int64)
+    for bucket, count in rows:
+        counts[bucket] += count
+    return counts, np.linspace(low, high, bins + 1)
+
+def query_histogram(conn, columns, feature, selected_bins, table_name=TABLE_NAME, filters=()):
+    n, low, high, mean, mean_sq = conn.execute(plan_stats_query(columns, feature, table_name, filters)).fetchone()
+    if n == 0:
+        bins = bin_count(selected_bins, 0)
+        return histogram_aggregates(feature, np.zeros(bins, dtype=np.int64), np.linspace(0, 1, bins + 1), None, None)
+
+    bins = bin_count(selected_bins, n)
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    counts, edges = query_buckets(conn, columns, feature, low, high, bins, table_name, filters)
+
+    # KDE from a fine bucketed histogram, smoothed on our side
+    kde_x, kde_y = None, None
+    variance = (mean_sq - mean * mean) * n / (n - 1) if n > 1 else 0
+    if variance > 0:
+        bandwidth, kde_low, kde_high = kde_support(n, math.sqrt(variance), low, high)
+        binned, kde_edges = query_buckets(conn, columns, feature, kde_low, kde_high, KDE_BINS, table_name, filters)
+        kde_x, kde_y = smooth_binned(binned, kde_edges, n, bandwidth)
+
+    return histogram_aggregates(feature, counts, edges, kde_x, kde_y)
+
+def row_estimate(conn, table_name=TABLE_NAME):
+    # rowid span - two index lookups, unlike COUNT(*) which walks the whole table
+    # (the passenger id is the rowid, and ids are close to dense)
+    low, high = conn.execute(f'SELECT MIN(rowid), MAX(rowid) FROM {quote_identifier(table_name)}').fetchone()
+    return 0 if low is None else high - low + 1
+
+def complete_keys(conn, keys, table_name=TABLE_NAME, key=KEY_COLUMN):
+    # which of these rows the cleaned queries keep - columns added since the CSV was read (add_column) count too
+    query = (f'SELECT {quote_identifier(key)} FROM {quote_identifier(table_name)} '
+             f'WHERE {quote_identifier(key)} IN (SELECT value FROM json_each(?)) AND {cleaned_where(get_table_columns(conn, table_name))}')
+    return [row[0] for row in conn.execute(query, (json.dumps([int(value) for value in keys]),))]
+
+def query_sample(conn, columns, features, sample, table_name=TABLE_NAME, filters=()):
+    # TABLESAMPLE-style sample: probe random rowids through the primary key rather than scanning,
+    # so the cost follows the sample size, not the table size
+    # returns the cleaned, filtered sampled rows and the scale (rows in the table per probe), or None if it isn't worth sampling
+    low, high = conn.execute(f'SELECT MIN(rowid), MAX(rowid) FROM {quote_identifier(table_name)}').fetchone()
+    if low is None or sample >= high - low + 1:
+        return None
+    probes = json.dumps(random.sample(range(low, high + 1), sample))
+    names = ', '.join(check_feature(columns, feature) for feature in dict.fromkeys(features))
+    query = (f'SELECT {names} FROM {quote_identifier(table_name)} '
+             f'WHERE rowid IN (SELECT value FROM json_each(?)) AND {where_clause(columns, filters)}')
+    rows = pd.read_sql_query(query, conn, params=(probes,))
+    # the same compact types the CSV path loads with
+    return rows.astype(schema_dtypes(rows)), (high - low + 1) / sample
+
+def aggregate_graph_data_sqlite(conn, selected_graph_type, selected_first_feature, selected_second_feature, selected_bins, table_name=TABLE_NAME, filters=(), sample=0):
+    columns = get_table_columns(conn, table_name)
+
+    if sample and sample > 0:
+        features = [selected_first_feature] + ([selected_second_feature] if selected_second_feature else [])
+        sampled = query_sample(conn, columns, features, sample, table_name, filters)
+        if sampled is not None:
+            # only a few thousand rows come back, aggregate them on our side
+            return sampled_aggregates(selected_graph_type, selected_first_feature, selected_second_feature, sampled[0], selected_bins, sampled[1])
+
+    if selected_graph_type == 'Bar Plot':
+        counts = query_counts(conn, columns, selected_first_feature, selected_second_feature, table_name, filters)
+        return bar_aggregates('Bar Plot', selected_first_feature, selected_second_feature, counts)
+
+    if selected_graph_type == 'Histogram':
+        check_feature(columns, selected_first_feature)
+        # text columns can't be binned, count each value instead
+        if not is_numeric_column(columns, selected_first_feature):
+            counts = query_counts(conn, columns, selected_first_feature, None, table_name, filters)
+            return bar_aggregates('Histogram', selected_first_feature, None, counts)
+        return query_histogram(conn, columns, selected_first_feature, selected_bins, table_name, filters)
+
+    return {'graph_type': selected_graph_type}
+
+def sql_type(dtype):
+    # declared SQLite type for a pandas dtype
+    dtype = pd.api.types.pandas_dtype(dtype)
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'
+
+def value_sql_type(value):
+    # declared type for a column whose default is value
+    if isinstance(value, (bool, int, np.integer)):
+        return 'INTEGER'
+    if isinstance(value, (float, np.floating)):
+        return 'REAL'
+    return 'TEXT'
+
+def quote_literal(value):
+    if value is None:
+        return 'NULL'
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+def column_types(columns):
+    # columns - name -> pandas dtype or declared type, the passenger schema wins where it has the column
+    types = {}
+    for column, column_type in columns.items():
+        if column in PASSENGER_SCHEMA:
+            types[column] = sql_type(PASSENGER_SCHEMA[column])
+        elif isinstance(column_type, str):
+            types[column] = column_type or 'TEXT'
+        else:
+            types[column] = sql_type(column_type)
+    return types
+
+def create_table_sql(table_name, types, key=KEY_COLUMN):
+    # INTEGER PRIMARY KEY makes the passenger id the rowid - upserts and lookups go straight to the row
+    definitions = [f'{quote_identifier(column)} {column_type}' + (' PRIMARY KEY' if column == key else '')
+                   for column, column_type in types.items()]
+    return f'CREATE TABLE {quote_identifier(table_name)} ({", ".join(definitions)})'
+
+def get_primary_key(conn, table_name=TABLE_NAME):
+    # PRAGMA returns a tuple - 1 = name of column, 5 = pk
+    rows = conn.execute(f"PRAGMA table_info({quote_identifier(table_name)})").fetchall()
+    keys = [row[1] for row in rows if row[5]]
+    return keys[0] if len(keys) == 1 else None
+
+def rebuild_table(conn, table_name=TABLE_NAME, key=KEY_COLUMN):
+    # tables made by to_sql have loose types and no primary key - copy the rows into a typed table
+    columns = get_table_columns(conn, table_name)
+    names = ', '.join(quote_identifier(column) for column in columns)
+    rebuilt = f'{table_name}_rebuild'
+    conn.execute(f'DROP TABLE IF EXISTS {quote_identifier(rebuilt)}')
+    conn.execute(create_table_sql(rebuilt, column_types(columns), key))
+    conn.execute(f'INSERT INTO {quote_identifier(rebuilt)} ({names}) SELECT {names} FROM {quote_identifier(table_name)}')
+    conn.execute(f'DROP TABLE {quote_identifier(table_name)}')
+    conn.execute(f'ALTER TABLE {quote_identifier(rebuilt)} RENAME TO {quote_identifier(table_name)}')
+
+def refresh_clean_flag(conn, table_name=TABLE_NAME):
+    # (re)work out complete_row for every row, and the triggers that keep it right for new/changed rows
+    # needed again whenever a column is added, since 'complete' then covers that column too
+    columns = get_table_columns(conn, table_name)
+    table = quote_identifier(table_name)
+    if CLEAN_FLAG not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {quote_identifier(CLEAN_FLAG)} INTEGER')
+    condition = complete_condition(columns)
+    watched = ', '.join(quote_identifier(column) for column in columns if column != CLEAN_FLAG)
+    set_flag = f'UPDATE {table} SET {quote_identifier(CLEAN_FLAG)} = ({condition}) WHERE rowid = NEW.rowid;'
+    for event, trigger_event in [('insert', 'INSERT'), ('update', f'UPDATE OF {watched}')]:
+        trigger = quote_identifier(f'{table_name}_{CLEAN_FLAG}_{event}')
+        conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        conn.execute(f'CREATE TRIGGER {trigger} AFTER {trigger_event} ON {table} BEGIN {set_flag} END')
+    conn.execute(f'UPDATE {table} SET {quote_identifier(CLEAN_FLAG)} = ({condition})')
+
+def create_group_indexes(conn, table_name=TABLE_NAME):
+    # one covering index per group column: (complete_row, column, the other group columns)
+    # so one- and two-way counts over the cleaned rows are read from an index alone
+    columns = get_table_columns(conn, table_name)
+    group_columns = [column for column in GROUP_COLUMNS if column in columns]
+    for column in group_columns:
+        indexed = [CLEAN_FLAG, column] + [other for other in group_columns if other != column]
+        index_name = quote_identifier(f'{table_name}_{column}')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON {quote_identifier(table_name)} '
+                     f'({", ".join(quote_identifier(name) for name in indexed)})')
+
+def has_managed_schema(conn, table_name=TABLE_NAME, key=KEY_COLUMN):
+    trigger = f'{table_name}_{CLEAN_FLAG}_insert'
+    row = conn.execute("SELECT name FROM sqlite_master WHERE type='trigger' AND name=?", (trigger,)).fetchone()
+    return row is not None and get_primary_key(conn, table_name) == key
+
+def ensure_schema(conn, table_name=TABLE_NAME, key=KEY_COLUMN):
+    # bring a table up to the managed schema: typed columns with the passenger id as primary key,
+    # the complete_row flag and the covering indexes - returns True if anything had to be done
+    if has_managed_schema(conn, table_name, key):
+        return False
+    if get_primary_key(conn, table_name) != key:
+        rebuild_table(conn, table_name, key)
+    refresh_clean_flag(conn, table_name)
+    create_group_indexes(conn, table_name)
+    return True
+
+def add_column(conn, column_name, sql_column_type='TEXT', default_value=None, table_name=TABLE_NAME):
+    # typed column addition - numbers stay numbers, so filtering/sorting on them uses numeric comparisons
+    conn.execute('BEGIN')
+    try:
+        conn.execute(f'ALTER TABLE {quote_identifier(table_name)} ADD COLUMN {quote_identifier(column_name)} '
+                     f'{sql_column_type} DEFAULT {quote_literal(default_value)}')
+        if has_managed_schema(conn, table_name):
+            refresh_clean_flag(conn, table_name)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    analyze(conn, table_name)
+
+def analyze(conn, table_name=TABLE_NAME):
+    # fresh statistics after a bulk change, so the planner picks the covering indexes
+    conn.execute(f'ANALYZE {quote_identifier(table_name)}')
+    conn.commit()
+
+def optimize(conn):
+    # cheap upkeep - only re-analyzes tables whose statistics look out of date
+    conn.execute('PRAGMA analysis_limit=1000')
+    conn.execute('PRAGMA optimize')
+
+def tune_connection(conn):
+    # WAL lets readers carry on while we write, NORMAL skips an fsync per commit
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+
+def table_exists(conn, table_name=TABLE_NAME):
+    row = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,)).fetchone()
+    return row is not None
+
+def create_checkpoint_table(conn):
+    conn.execute('CREATE TABLE IF NOT EXISTS ingest_checkpoint '
+                 '(table_name TEXT PRIMARY KEY, source TEXT, rows_loaded INTEGER, complete INTEGER)')
+
+def get_checkpoint(conn, table_name=TABLE_NAME):
+    if not table_exists(conn, 'ingest_checkpoint'):
+        return None
+    row = conn.execute('SELECT source, rows_loaded, complete FROM ingest_checkpoint WHERE table_name=?', (table_name,)).fetchone()
+    if row is None:
+        return None
+    return {'source': row[0], 'rows_loaded': row[1], 'complete': bool(row[2])}
+
+def needs_ingest(conn, table_name=TABLE_NAME):
+    # missing table, or a streaming load that was interrupted part way
+    # tables loaded before checkpoints existed have no checkpoint row and count as done
+    if not table_exists(conn, table_name):
+        return True
+    checkpoint = get_checkpoint(conn, table_name)
+    return checkpoint is not None and not checkpoint['complete']
+
+def print_progress(rows_loaded, rows_per_second):
+    print(f'Loaded {rows_loaded} rows ({rows_per_second:.0f} rows/s)')
+
+def ingest_csv(conn, csv_path, table_name=TABLE_NAME, chunk_size=INGEST_CHUNK_SIZE, progress=print_progress):
+    tune_connection(conn)
+    create_checkpoint_table(conn)
+    conn.commit()
+
+    source = os.path.abspath(csv_path)
+    # rows past this point are left for sync_csv
+    end_offset = csv_end_offset(csv_path)
+    checkpoint = get_checkpoint(conn, table_name)
+    if checkpoint is not None and checkpoint['source'] != source:
+        raise ValueError(f"'{table_name}' was loaded from {checkpoint['source']}, not {source}")
+    if checkpoint is not None and checkpoint['complete']:
+        return {'rows': 0, 'seconds': 0.0, 'rows_per_second': 0.0}
+    rows_done = checkpoint['rows_loaded'] if checkpoint is not None else 0
+
+    # skip the rows a previous (interrupted) run already committed, keep the header
+    chunks = pd.read_csv(csv_path, chunksize=chunk_size, skiprows=range(1, rows_done + 1))
+
+    start = time.perf_counter()
+    rows_loaded = 0
+    insert = None
+    for chunk in chunks:
+        if insert is None:
+            columns = ', '.join(quote_identifier(column) for column in chunk.columns)
+            placeholders = ', '.join('?' for _ in chunk.columns)
+            insert = f'INSERT INTO {quote_identifier(table_name)} ({columns}) VALUES ({placeholders})'
+
+        # NaN -> None so SQLite stores NULL, object dtype gives plain Python values
+        rows = chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None)
+
+        # one transaction per chunk - the rows and the checkpoint commit together
+        conn.execute('BEGIN')
+        try:
+            if not table_exists(conn, table_name):
+                conn.execute(create_table_sql(table_name, column_types(chunk.dtypes.to_dict())))
+            conn.executemany(insert, rows)
+            rows_done += len(chunk)
+            conn.execute('INSERT OR REPLACE INTO ingest_checkpoint VALUES (?, ?, ?, 0)', (table_name, source, rows_done))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        rows_loaded += len(chunk)
+        if progress is not None:
+            progress(rows_done, rows_loaded / (time.perf_counter() - start))
+
+    conn.execute('BEGIN')
+    try:
+        conn.execute('INSERT OR REPLACE INTO ingest_checkpoint VALUES (?, ?, ?, 1)', (table_name, source, rows_done))
+        # the flag and indexes are built once the rows are in, faster than keeping them up to date row by row
+        ensure_schema(conn, table_name)
+        save_sync_state(conn, table_name, source, end_offset)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    analyze(conn, table_name)
+
+    seconds = time.perf_counter() - start
+    return {'rows': rows_loaded, 'seconds': seconds, 'rows_per_second': rows_loaded / seconds if seconds else 0.0}
+
+def create_sync_table(conn):
+    # how far into the source CSV the table is up to
+    conn.execute('CREATE TABLE IF NOT EXISTS sync_state '
+                 '(table_name TEXT PRIMARY KEY, source TEXT, byte_offset INTEGER, high_water INTEGER)')
+
+def get_sync_state(conn, table_name=TABLE_NAME):
+    if not table_exists(conn, 'sync_state'):
+        return None
+    row = conn.execute('SELECT source, byte_offset, high_water FROM sync_state WHERE table_name=?', (table_name,)).fetchone()
+    if row is None:
+        return None
+    return {'source': row[0], 'byte_offset': row[1], 'high_water': row[2]}
+
+def get_high_water(conn, table_name=TABLE_NAME, key=KEY_COLUMN):
+    return conn.execute(f'SELECT MAX({quote_identifier(key)}) FROM {quote_identifier(table_name)}').fetchone()[0]
+
+def save_sync_state(conn, table_name, source, byte_offset, key=KEY_COLUMN):
+    create_sync_table(conn)
+    conn.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)',
+                 (table_name, source, byte_offset, get_high_water(conn, table_name, key)))
+
+def upsert_rows(conn, rows, table_name=TABLE_NAME, key=KEY_COLUMN):
+    # insert new passengers, overwrite the ones that are already there
+    # only the table's columns are written, so columns added later (add_column_to_table) are kept
+    # (complete_row is set by the triggers)
+    table_columns = get_table_columns(conn, table_name)
+    columns = [column for column in rows.columns if column in table_columns]
+    names = ', '.join(quote_identifier(column) for column in columns)
+    placeholders = ', '.join('?' for _ in columns)
+    updates = ', '.join(f'{quote_identifier(column)}=excluded.{quote_identifier(column)}' for column in columns if column != key)
+    upsert = (f'INSERT INTO {quote_identifier(table_name)} ({names}) VALUES ({placeholders}) '
+              f'ON CONFLICT({quote_identifier(key)}) DO UPDATE SET {updates}')
+    rows = rows[columns]
+    conn.executemany(upsert, rows.astype(object).where(rows.notna(), None).itertuples(index=False, name=None))
+
+def read_rows_above(csv_path, high_water, key=KEY_COLUMN, chunk_size=INGEST_CHUNK_SIZE):
+    # no offset recorded (table loaded before syncing existed) - scan the CSV for passenger ids past the high-water mark
+    chunks = [chunk[chunk[key] > high_water] for chunk in pd.read_csv(csv_path, chunksize=chunk_size)]
+    return pd.concat(chunks, ignore_index=True)
+
+def sync_csv(conn, csv_path, table_name=TABLE_NAME, key=KEY_COLUMN):
+    # bring an already loaded table up to date with rows appended to the CSV since,
+    # reading only the new bytes - rows are upserted on the passenger id so syncing twice is harmless
+    tune_connection(conn)
+    source = os.path.abspath(csv_path)
+    end_offset = csv_end_offset(csv_path)
+    state = get_sync_state(conn, table_name)
+    high_water = get_high_water(conn, table_name, key)
+
+    start = time.perf_counter()
+    if state is not None and state['source'] == source and state['byte_offset'] <= end_offset:
+        new_rows, end_offset = read_csv_since(csv_path, state['byte_offset'], end_offset)
+    else:
+        # first sync, a different file, or the file was rewritten shorter
+        new_rows = read_rows_above(csv_path, high_water if high_water is not None else float('-inf'), key)
+
+    conn.execute('BEGIN')
+    try:
+        migrated = ensure_schema(conn, table_name, key)
+        if len(new_rows):
+            upsert_rows(conn, new_rows, table_name, key)
+        save_sync_state(conn, table_name, source, end_offset, key)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if migrated:
+        analyze(conn, table_name)
+    else:
+        optimize(conn)
+
+    # rows at or below the old high-water mark may have replaced existing passengers
+    appended_only = high_water is None or bool((new_rows[key] > high_water).all())
+    seconds = time.perf_counter() - start
+    return {'rows': len(new_rows), 'new_rows': new_rows, 'appended_only': appended_only, 'seconds': seconds}
+
+def create_features_table(conn):
+    # which version of each derived feature is stored, and the source version it was worked out at
+    conn.execute('CREATE TABLE IF NOT EXISTS derived_features '
+                 '(table_name TEXT, feature TEXT, signature TEXT, source_version TEXT, PRIMARY KEY (table_name, feature))')
+
+def source_version(conn, table_name=TABLE_NAME, key=KEY_COLUMN):
+    # where the table's data is up to - loads and syncs are the only writers, and both move this on
+    state = get_sync_state(conn, table_name)
+    if state is not None:
+        return f"{state['byte_offset']}:{state['high_water']}"
+    return f'high_water:{get_high_water(conn, table_name, key)}'
+
+def stored_features(conn, table_name=TABLE_NAME):
+    if not table_exists(conn, 'derived_features'):
+        return {}
+    rows = conn.execute('SELECT feature, signature, source_version FROM derived_features WHERE table_name=?', (table_name,))
+    return {feature: (signature, version) for feature, signature, version in rows}
+
+def fresh_features(conn, table_name=TABLE_NAME, key=KEY_COLUMN):
+    # derived features stored with their current definition at the current source version
+    version = source_version(conn, table_name, key)
+    return [name for name, stored in stored_features(conn, table_name).items()
+            if name in DERIVED_FEATURES and stored == (feature_signature(name), version)]
+
+def stale_features(conn, table_name=TABLE_NAME, key=KEY_COLUMN):
+    # derived features that are missing, were stored with an old definition, or from older data
+    columns = [column for column in get_table_columns(conn, table_name) if column not in DERIVED_FEATURES]
+    fresh = fresh_features(conn, table_name, key)
+    return [name for name in derived_names(columns) if name not in fresh]
+
+def store_features(conn, names, table_name=TABLE_NAME, key=KEY_COLUMN, keys=None, chunk_size=INGEST_CHUNK_SIZE):
+    # work out derived features from their input columns and write them back in bulk -
+    # every row, or just the rows with these passenger ids (e.g. the ones a sync brought in)
+    # each chunk is computed with vectorised pandas ops, staged in a temp table and applied with one UPDATE ... FROM
+    start = time.perf_counter()
+    table = quote_identifier(table_name)
+    key_name = quote_identifier(key)
+    inputs = feature_inputs(names)
+    select = f'SELECT {key_name}, {", ".join(quote_identifier(column) for column in inputs)} FROM {table}'
+    params = ()
+    if keys is not None:
+        select += f' WHERE {key_name} IN (SELECT value FROM json_each(?))'
+        params = (json.dumps([int(value) for value in keys]),)
+    staged = ', '.join(f'{quote_identifier(name)} {sql_type(DERIVED_FEATURES[name]["dtype"])}' for name in names)
+    insert = f'INSERT INTO temp.derived_rows VALUES ({", ".join("?" for _ in range(len(names) + 1))})'
+    updates = ', '.join(f'{quote_identifier(name)} = derived_rows.{quote_identifier(name)}' for name in names)
+    rows = 0
+
+    conn.execute('BEGIN')
+    try:
+        columns = get_table_columns(conn, table_name)
+        added = [name for name in names if name not in columns]
+        for name in added:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {quote_identifier(name)} {sql_type(DERIVED_FEATURES[name]["dtype"])}')
+        conn.execute('DROP TABLE IF EXISTS temp.derived_rows')
+        conn.execute(f'CREATE TEMP TABLE derived_rows ({key_name} INTEGER PRIMARY KEY, {staged})')
+        for chunk in pd.read_sql_query(select, conn, params=params, chunksize=chunk_size):
+            derived = derive_features(chunk, names)
+            derived.insert(0, key, chunk[key])
+            conn.executemany(insert, derived.astype(object).where(derived.notna(), None).itertuples(index=False, name=None))
+            rows += len(chunk)
+        conn.execute(f'UPDATE {table} SET {updates} FROM temp.derived_rows WHERE {table}.{key_name} = derived_rows.{key_name}')
+        conn.execute('DROP TABLE temp.derived_rows')
+        # new columns count towards complete_row too - refreshed once the values are in
+        if added and has_managed_schema(conn, table_name, key):
+            refresh_clean_flag(conn, table_name)
+        create_features_table(conn)
+        version = source_version(conn, table_name, key)
+        conn.executemany('INSERT OR REPLACE INTO derived_features VALUES (?, ?, ?, ?)',
+                         [(table_name, name, feature_signature(name), version) for name in names])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if added:
+        analyze(conn, table_name)
+    return {'features': list(names), 'rows': rows, 'seconds': time.perf_counter() - start}
+
+def create_cube_tables(conn):
+    # the data cube (titanic_cube) - one row per value (pair) of every one- and two-way count table,
+    # and what it was worked out over (the table's columns) and up to (the source version)
+    conn.execute('CREATE TABLE IF NOT EXISTS cube_counts (table_name TEXT, first_feature TEXT, second_feature TEXT, '
+                 'first_value, second_value, count INTEGER, '
+                 'PRIMARY KEY (table_name, first_feature, second_feature, first_value, second_value))')
+    conn.execute('CREATE TABLE IF NOT EXISTS cube_state (table_name TEXT PRIMARY KEY, signature TEXT, source_version TEXT)')
+
+def cube_fresh(conn, table_name=TABLE_NAME, key=KEY_COLUMN, columns=None):
+    # the cube was worked out over these columns, up to the current source version
+    if not table_exists(conn, 'cube_state'):
+        return False
+    row = conn.execute('SELECT signature, source_version FROM cube_state WHERE table_name=?', (table_name,)).fetchone()
+    if columns is None:
+        columns = get_table_columns(conn, table_name)
+    signature = cube_signature([column for column in columns if column != CLEAN_FLAG])
+    return row == (signature, source_version(conn, table_name, key))
+
+def cube_counts(conn, columns, first_feature, second_feature=None, table_name=TABLE_NAME, key=KEY_COLUMN):
+    # count table from the cube - None if it doesn't cover these columns or is out of date
+    features = [first_feature] + ([second_feature] if second_feature else [])
+    if not covers(first_feature, second_feature) or any(feature not in columns for feature in features):
+        return None
+    if not cube_fresh(conn, table_name, key, columns):
+        return None
+    rows = conn.execute('SELECT first_value, second_value, count FROM cube_counts '
+                        'WHERE table_name=? AND first_feature=? AND second_feature=?',
+                        (table_name,) + cube_key(first_feature, second_feature)).fetchall()
+    return count_frame(rows, first_feature, second_feature)
+
+def query_cells(conn, columns, table_name=TABLE_NAME, key=KEY_COLUMN, keys=None):
+    # base cells of the cube - cleaned rows counted per combination of the cube columns, in one grouped pass
+    grouped = cube_columns(columns)
+    if not grouped:
+        return pd.DataFrame(columns=['count'])
+    names = ', '.join(quote_identifier(column) for column in grouped)
+    query = f'SELECT {names}, COUNT(*) FROM {quote_identifier(table_name)} WHERE {cleaned_where(columns)}'
+    params = ()
+    if keys is not None:
+        query += f' AND {quote_identifier(key)} IN (SELECT value FROM json_each(?))'
+        params = (json.dumps([int(value) for value in keys]),)
+    return pd.DataFrame(conn.execute(f'{query} GROUP BY {names}', params).fetchall(), columns=grouped + ['count'])
+
+def store_cube(conn, table_name=TABLE_NAME, key=KEY_COLUMN, keys=None):
+    # work the cube out from every cleaned row, or add on the counts of just the rows with these passenger ids
+    # (only right if they're new rows - replaced rows would be counted twice)
+    start = time.perf_counter()
+    conn.execute('BEGIN')
+    try:
+        create_cube_tables(conn)
+        columns = get_table_columns(conn, table_name)
+        cells = query_cells(conn, columns, table_name, key, keys)
+        if keys is None:
+            conn.execute('DELETE FROM cube_counts WHERE table_name=?', (table_name,))
+        conn.executemany('INSERT INTO cube_counts VALUES (?, ?, ?, ?, ?, ?) '
+                         'ON CONFLICT (table_name, first_feature, second_feature, first_value, second_value) '
+                         'DO UPDATE SET count = count + excluded.count',
+                         [(table_name,) + entry for entry in cube_entries(cells)])
+        signature = cube_signature([column for column in columns if column != CLEAN_FLAG])
+        conn.execute('INSERT OR REPLACE INTO cube_state VALUES (?, ?, ?)',
+                     (table_name, signature, source_version(conn, table_name, key)))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {'cells': len(cells), 'seconds': time.perf_counter() - start}
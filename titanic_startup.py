@@ -0,0 +1,58 @@
+import csv
+import importlib
+import sys
+import threading
+import time
+
+# fast startup helpers for the GUIs - only uses the standard library so it's cheap to import
+# heavy modules (pandas, matplotlib, seaborn...) are imported in the background once the window is up
+
+# modules the GUIs need for their first graph
+HEAVY_MODULES = ['numpy', 'pandas', 'matplotlib', 'seaborn', 'titanic_data', 'titanic_aggregate', 'titanic_graph', 'titanic_canvas']
+
+START = time.perf_counter()
+
+# (label, seconds since start) for each startup milestone
+startup_marks = []
+# seconds each deferred import took
+import_times = {}
+
+def mark(label):
+    startup_marks.append((label, time.perf_counter() - START))
+
+def timed_import(name):
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    import_times.setdefault(name, time.perf_counter() - start)
+    return module
+
+def preload(names=HEAVY_MODULES):
+    # import on a background thread so the first click doesn't pay for it
+    def run():
+        for name in names:
+            timed_import(name)
+        mark('heavy imports done')
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+def read_csv_header(csv_path):
+    # column names without loading pandas or the rest of the file
+    with open(csv_path, newline='') as f:
+        return next(csv.reader(f), [])
+
+def wants_startup_report():
+    return '--startup-report' in sys.argv
+
+def startup_report():
+    # like python -X importtime, but only for the milestones and deferred imports we care about
+    # run the GUI with -X importtime for the full per-module breakdown
+    lines = ['Startup report:']
+    for label, seconds in startup_marks:
+        lines.append(f'  {seconds * 1000:8.1f} ms  {label}')
+    for name, seconds in sorted(import_times.items(), key=lambda item: -item[1]):
+        lines.append(f'  {seconds * 1000:8.1f} ms  import {name}')
+    return '\n'.join(lines)
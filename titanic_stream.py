@@ -0,0 +1,435 @@
+import argparse
+import io
+import math
+import os
+import random
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote
+import numpy as np
+import pandas as pd
+from titanic_aggregate import (bar_aggregates, bin_count, count_table, histogram_aggregates, kde_support,
+                               merge_counts, sampled_aggregates, smooth_binned, KDE_BINS)
+from titanic_data import DROPPED_COLUMNS, KEY_COLUMN, clean_frame, csv_end_offset, read_csv_since, schema_dtypes
+from titanic_features import add_features
+from titanic_filters import filter_mask
+
+# out-of-core aggregation - for tables too big to load into one DataFrame
+# the source (a CSV file, a SQLite table or a MongoDB collection) is split into chunks, each chunk is
+# read, cleaned and filtered on its own and boiled down to a small partial aggregate, and the partials
+# are merged. Chunks run in parallel across a process pool, so memory is about workers * chunk size
+# however big the table is
+#
+# partial aggregates (all of them merge in any order):
+#   count tables             - added together (merge_counts)
+#   column stats             - count/min/max/mean/M2, merged with Chan's formula
+#   fixed-edge histograms    - the edges come from the stats pass, so the bin counts just add up
+#   quantile sketches        - for box plots, see QuantileSketch
+#
+# a source is a plain dict so it can be sent to the worker processes:
+#   {'kind': 'csv', 'path': 'train.csv'}
+#   {'kind': 'sqlite', 'path': 'titanic.db', 'table': 'titanic_data'}
+#   {'kind': 'mongo', 'uri': ..., 'db': 'Titanic-Data', 'collection': 'Titanic-V1'}
+#
+#   python titanic_stream.py --csv big.csv --out reports                  (the streamable titanic.py plots)
+#   python titanic_stream.py --csv big.csv --graph 'Box Plot,Pclass,Fare'
+
+# bytes of CSV per chunk
+STREAM_CHUNK_BYTES = 32 * 1024 * 1024
+# rows per chunk from a database
+STREAM_CHUNK_ROWS = 250000
+# relative accuracy of the quantile sketches (1%)
+SKETCH_ACCURACY = 0.01
+
+# the titanic.py plots that only need mergeable aggregates (the scatter and per-row plots need the rows)
+STREAM_PLOTS = [
+    {'name': 'survival_counts', 'graph_type': 'Bar Plot', 'first_feature': 'Survived', 'palette': 'deep'},
+    {'name': 'class_counts', 'graph_type': 'Bar Plot', 'first_feature': 'Pclass', 'palette': 'viridis',
+     'xlabel': 'Passenger Class', 'ylabel': 'Count', 'title': 'Passenger Class Counts'},
+    {'name': 'age_histogram', 'graph_type': 'Histogram', 'first_feature': 'Age', 'bins': 30, 'palette': 'deep',
+     'xlabel': 'Age', 'ylabel': 'Frequency', 'title': 'Histogram for Passenger Ages'},
+    {'name': 'fare_by_class', 'graph_type': 'Box Plot', 'first_feature': 'Pclass', 'second_feature': 'Fare', 'palette': 'Set2',
+     'xlabel': 'Passenger Class', 'ylabel': 'Fare', 'title': 'Box Plot of Fare Distribution by Passenger Class'},
+]
+
+class QuantileSketch:
+    # relative-error quantile sketch (DDSketch) - values are counted in log-spaced buckets,
+    # so any quantile comes back within SKETCH_ACCURACY of the true value
+    # two sketches merge by adding bucket counts, and the number of buckets grows with
+    # log(max / min) of the values, not with the number of rows
+    def __init__(self, relative_accuracy=SKETCH_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        # bucket index -> count, for positive values and (mirrored) negative values
+        self.positive = {}
+        self.negative = {}
+        self.zeros = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not values.size:
+            return self
+        self.count += values.size
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.zeros += int(np.count_nonzero(values == 0))
+        for buckets, side in [(self.positive, values[values > 0]), (self.negative, -values[values < 0])]:
+            indexes, counts = np.unique(np.ceil(np.log(side) / self.log_gamma).astype(np.int64), return_counts=True)
+            for index, count in zip(indexes.tolist(), counts.tolist()):
+                buckets[index] = buckets.get(index, 0) + count
+        return self
+
+    def merge(self, other):
+        for buckets, other_buckets in [(self.positive, other.positive), (self.negative, other.negative)]:
+            for index, count in other_buckets.items():
+                buckets[index] = buckets.get(index, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def bucket_value(self, index):
+        # the middle of the bucket in relative terms, at most relative_accuracy away from anything in it
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def values(self):
+        # (value, count) for every bucket, smallest first
+        values = [(-self.bucket_value(index), count) for index, count in sorted(self.negative.items(), reverse=True)]
+        if self.zeros:
+            values.append((0.0, self.zeros))
+        values += [(self.bucket_value(index), count) for index, count in sorted(self.positive.items())]
+        return values
+
+    def quantile(self, q):
+        if not self.count:
+            return math.nan
+        rank = q * (self.count - 1)
+        seen = 0
+        for value, count in self.values():
+            seen += count
+            if seen > rank:
+                # the exact min/max are known, never report past them
+                return min(max(value, self.min), self.max)
+        return self.max
+
+def box_stats(sketch, label):
+    # what matplotlib's bxp() draws - quartiles, whiskers at the furthest values within 1.5 IQR, fliers beyond
+    # fliers are one point per bucket (plus the exact extremes) so there are never more than the buckets
+    q1, median, q3 = sketch.quantile(0.25), sketch.quantile(0.5), sketch.quantile(0.75)
+    low_fence, high_fence = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+    values = [min(max(value, sketch.min), sketch.max) for value, _ in sketch.values()]
+    inside = [value for value in values if low_fence <= value <= high_fence]
+    fliers = sorted({value for value in values + [sketch.min, sketch.max] if value < low_fence or value > high_fence})
+    return {'label': label, 'q1': q1, 'med': median, 'q3': q3,
+            'whislo': min(inside) if inside else q1, 'whishi': max(inside) if inside else q3,
+            'fliers': np.array(fliers), 'count': sketch.count}
+
+def box_aggregates(group_feature, value_feature, sketches):
+    return {
+        'graph_type': 'Box Plot',
+        'first_feature': group_feature,
+        'second_feature': value_feature,
+        'boxes': [box_stats(sketches[group], group) for group in sorted(sketches)],
+    }
+
+def merge_stats(stats, other):
+    # (count, min, max, mean, M2, numeric) - Chan et al.'s parallel variance update
+    n, low, high, mean, m2, numeric = stats
+    other_n, other_low, other_high, other_mean, other_m2, other_numeric = other
+    numeric = numeric and other_numeric
+    if not other_n:
+        return (n, low, high, mean, m2, numeric)
+    if not n:
+        return (other_n, other_low, other_high, other_mean, other_m2, numeric)
+    total = n + other_n
+    delta = other_mean - mean
+    return (total, min(low, other_low), max(high, other_high), mean + delta * other_n / total,
+            m2 + other_m2 + delta * delta * n * other_n / total, numeric)
+
+def column_stats(column):
+    if not pd.api.types.is_numeric_dtype(column):
+        return (0, math.inf, -math.inf, 0.0, 0.0, False)
+    values = column.dropna().to_numpy(dtype=float)
+    if not values.size:
+        return (0, math.inf, -math.inf, 0.0, 0.0, True)
+    mean = values.mean()
+    return (values.size, values.min(), values.max(), mean, float(((values - mean) ** 2).sum()), True)
+
+def partial_aggregate(plan, chunk):
+    # the partial aggregate of one cleaned, filtered chunk
+    kind = plan[0]
+    if kind == 'counts':
+        return count_table(chunk, plan[1], plan[2])
+    if kind == 'stats':
+        return column_stats(chunk[plan[1]])
+    if kind == 'bins':
+        _, feature, low, high, bins, kde_low, kde_high = plan
+        values = chunk[feature].dropna().to_numpy(dtype=float)
+        counts = np.histogram(values, bins=bins, range=(low, high))[0]
+        binned = np.histogram(values, bins=KDE_BINS, range=(kde_low, kde_high))[0] if kde_low is not None else None
+        return counts, binned
+    if kind == 'sketch':
+        _, group_feature, value_feature = plan
+        return {group: QuantileSketch().add(values) for group, values in chunk.groupby(group_feature, observed=True)[value_feature]}
+    raise ValueError(f"Unknown plan '{kind}'")
+
+def merge_partials(plan, partials):
+    kind = plan[0]
+    merged = None
+    for partial in partials:
+        if merged is None:
+            merged = partial
+        elif kind == 'counts':
+            merged = merge_counts(merged, partial)
+        elif kind == 'stats':
+            merged = merge_stats(merged, partial)
+        elif kind == 'bins':
+            merged = (merged[0] + partial[0], merged[1] + partial[1] if merged[1] is not None else None)
+        elif kind == 'sketch':
+            for group, sketch in partial.items():
+                merged[group] = merged[group].merge(sketch) if group in merged else sketch
+    if merged is None and kind == 'stats':
+        return (0, math.inf, -math.inf, 0.0, 0.0, True)
+    if merged is None and kind == 'sketch':
+        return {}
+    return merged
+
+def csv_names(csv_path):
+    return list(read_csv_since(csv_path, 0, 0)[0].columns)
+
+def csv_ranges(csv_path, chunk_bytes=STREAM_CHUNK_BYTES):
+    # line aligned (start, end) byte ranges covering the data rows
+    # (assumes no quoted newlines inside fields, true of the passenger CSVs)
+    end = csv_end_offset(csv_path)
+    ranges = []
+    with open(csv_path, 'rb') as f:
+        start = len(f.readline())
+        while start < end:
+            f.seek(min(start + chunk_bytes, end))
+            f.readline()
+            stop = min(f.tell(), end)
+            ranges.append((start, stop))
+            start = stop
+    return ranges
+
+def estimate_csv_rows(csv_path, probe_bytes=64 * 1024):
+    # from the file size and the line length near the top of the file, no full read
+    with open(csv_path, 'rb') as f:
+        header = f.readline()
+        block = f.read(probe_bytes)
+    lines = block.count(b'\n')
+    if not lines:
+        return 0
+    return round((csv_end_offset(csv_path) - len(header)) / (len(block[:block.rfind(b'\n') + 1]) / lines))
+
+def schema_types(chunk):
+    # the passenger schema (and derived feature types), minus categoricals - each chunk would get its own categories,
+    # which don't merge
+    return schema_dtypes(chunk, categories=False)
+
+def clean_chunk(chunk, filters=()):
+    # the same rows clean_data keeps, with the same (nullable) types whichever chunk they came from
+    # derived features the chunk has the inputs for are worked out first (they can be filtered on too)
+    chunk = clean_frame(add_features(chunk))
+    chunk = chunk.astype(schema_types(chunk))
+    if filters:
+        chunk = chunk[filter_mask(chunk, filters)]
+    return chunk
+
+_mongo_clients = {}
+
+def mongo_collection(source):
+    # one client per process, made on first use (clients can't be sent to the workers)
+    from pymongo import MongoClient
+    client = _mongo_clients.get(source['uri'])
+    if client is None:
+        client = _mongo_clients[source['uri']] = MongoClient(source['uri'])
+    return client[source['db']][source['collection']]
+
+def chunk_ranges(source, chunk_bytes=STREAM_CHUNK_BYTES, chunk_rows=STREAM_CHUNK_ROWS):
+    # how the source is split - byte ranges of a CSV, rowid ranges of a SQLite table,
+    # passenger id ranges of a MongoDB collection (both on an index, so every chunk is a range scan)
+    kind = source['kind']
+    if kind == 'csv':
+        return csv_ranges(source['path'], chunk_bytes)
+    if kind == 'sqlite':
+        from titanic_sqlite import quote_identifier
+        with sqlite3.connect(source['path']) as conn:
+            low, high = conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {quote_identifier(source['table'])}").fetchone()
+    elif kind == 'mongo':
+        collection = mongo_collection(source)
+        first = collection.find_one({}, {KEY_COLUMN: 1}, sort=[(KEY_COLUMN, 1)])
+        last = collection.find_one({}, {KEY_COLUMN: 1}, sort=[(KEY_COLUMN, -1)])
+        low, high = (first[KEY_COLUMN], last[KEY_COLUMN]) if first else (None, None)
+    else:
+        raise ValueError(f"Unknown source '{kind}'")
+    if low is None:
+        return []
+    return [(start, min(start + chunk_rows - 1, high)) for start in range(low, high + 1, chunk_rows)]
+
+def read_chunk(source, chunk_range, features, filters=()):
+    # one chunk's cleaned, filtered rows - just the feature columns
+    kind = source['kind']
+    features = list(dict.fromkeys(features))
+    if kind == 'csv':
+        # every kept column is read, a row missing any of them is dropped by the cleaning
+        names = csv_names(source['path'])
+        kept = [column for column in names if column not in DROPPED_COLUMNS]
+        chunk = read_csv_since(source['path'], chunk_range[0], chunk_range[1], kept)[0]
+        return clean_chunk(chunk, filters)[features]
+    if kind == 'sqlite':
+        # the database does the cleaning and filtering on the way out
+        from titanic_sqlite import check_feature, get_table_columns, quote_identifier, where_clause
+        conn = sqlite3.connect(f"file:{quote(os.path.abspath(source['path']))}?mode=ro", uri=True)
+        try:
+            columns = get_table_columns(conn, source['table'])
+            names = ', '.join(check_feature(columns, feature) for feature in features)
+            query = (f"SELECT {names} FROM {quote_identifier(source['table'])} "
+                     f"WHERE rowid BETWEEN ? AND ? AND {where_clause(columns, filters)}")
+            chunk = pd.read_sql_query(query, conn, params=chunk_range)
+        finally:
+            conn.close()
+        return chunk.astype(schema_types(chunk))
+    from titanic_mongo import cleaned_match, get_collection_columns
+    collection = mongo_collection(source)
+    match = cleaned_match(get_collection_columns(collection), filters)['$match']
+    match = {'$and': [match, {KEY_COLUMN: {'$gte': chunk_range[0], '$lte': chunk_range[1]}}]}
+    chunk = pd.DataFrame(list(collection.find(match, dict({feature: 1 for feature in features}, _id=0))), columns=features)
+    return chunk.astype(schema_types(chunk))
+
+def aggregate_chunk(task):
+    # runs in a worker - read one chunk and boil it down
+    source, chunk_range, plan, features, filters = task
+    return partial_aggregate(plan, read_chunk(source, chunk_range, features, filters))
+
+def run_plan(source, plan, features, filters=(), executor=None, ranges=None):
+    # every chunk through aggregate_chunk in parallel, merged as the partials come back
+    if ranges is None:
+        ranges = chunk_ranges(source)
+    tasks = [(source, chunk_range, plan, features, tuple(filters)) for chunk_range in ranges]
+    if executor is None:
+        return merge_partials(plan, map(aggregate_chunk, tasks))
+    return merge_partials(plan, executor.map(aggregate_chunk, tasks))
+
+def sample_csv_rows(csv_path, sample, filters=()):
+    # random rows without reading the whole file - seek to random offsets and take the next full line
+    # (a line's chance of being picked follows the length of the line before it, close enough for a preview)
+    # returns the cleaned, filtered rows and the scale (rows in the file per probe)
+    names = csv_names(csv_path)
+    end = csv_end_offset(csv_path)
+    lines = {}
+    with open(csv_path, 'rb') as f:
+        start = len(f.readline())
+        if end <= start:
+            return pd.DataFrame(columns=names), 1.0
+        for offset in sorted(random.randrange(start - 1, end) for _ in range(sample)):
+            f.seek(offset)
+            f.readline()
+            position = f.tell()
+            if position < end:
+                lines[position] = f.readline()
+    chunk = pd.read_csv(io.BytesIO(b''.join(lines.values())), header=None, names=names)
+    kept = [column for column in names if column not in DROPPED_COLUMNS]
+    return clean_chunk(chunk[kept], filters), estimate_csv_rows(csv_path) / sample
+
+def stream_graph_data(source, selected_graph_type, selected_first_feature, selected_second_feature, selected_bins,
+                      filters=(), sample=0, executor=None):
+    # the same aggregates as aggregate_graph_data, without ever holding the whole table
+    # histograms take two passes - column stats (for the fixed edges), then the bin counts
+    if sample and sample > 0:
+        if source['kind'] != 'csv':
+            raise ValueError('Streamed sampling is only for CSV sources - the database backends sample themselves')
+        if sample < estimate_csv_rows(source['path']):
+            sampled, scale = sample_csv_rows(source['path'], sample, filters)
+            return sampled_aggregates(selected_graph_type, selected_first_feature, selected_second_feature, sampled, selected_bins, scale)
+
+    ranges = chunk_ranges(source)
+    if selected_graph_type == 'Bar Plot':
+        features = [selected_first_feature] + ([selected_second_feature] if selected_second_feature else [])
+        counts = run_plan(source, ('counts', selected_first_feature, selected_second_feature or None), features, filters, executor, ranges)
+        return bar_aggregates('Bar Plot', selected_first_feature, selected_second_feature, counts)
+
+    if selected_graph_type == 'Histogram':
+        features = [selected_first_feature]
+        n, low, high, mean, m2, numeric = run_plan(source, ('stats', selected_first_feature), features, filters, executor, ranges)
+        # text columns can't be binned, count each value instead
+        if not numeric:
+            counts = run_plan(source, ('counts', selected_first_feature, None), features, filters, executor, ranges)
+            return bar_aggregates('Histogram', selected_first_feature, None, counts)
+        # same bins as every other backend when none are given
+        bins = bin_count(selected_bins, n)
+        if n == 0:
+            return histogram_aggregates(selected_first_feature, np.zeros(bins, dtype=np.int64), np.linspace(0, 1, bins + 1), None, None)
+        if low == high:
+            low, high = low - 0.5, high + 0.5
+        kde_low = kde_high = bandwidth = None
+        if n > 1 and m2 > 0:
+            bandwidth, kde_low, kde_high = kde_support(n, math.sqrt(m2 / (n - 1)), low, high)
+        plan = ('bins', selected_first_feature, low, high, bins, kde_low, kde_high)
+        counts, binned = run_plan(source, plan, features, filters, executor, ranges)
+        kde_x, kde_y = None, None
+        if binned is not None:
+            kde_x, kde_y = smooth_binned(binned, np.linspace(kde_low, kde_high, KDE_BINS + 1), n, bandwidth)
+        return histogram_aggregates(selected_first_feature, counts, np.linspace(low, high, bins + 1), kde_x, kde_y)
+
+    if selected_graph_type == 'Box Plot':
+        # the second feature's distribution for each value of the first (e.g. Fare by Pclass)
+        features = [selected_first_feature, selected_second_feature]
+        sketches = run_plan(source, ('sketch', selected_first_feature, selected_second_feature), features, filters, executor, ranges)
+        return box_aggregates(selected_first_feature, selected_second_feature, sketches)
+
+    return {'graph_type': selected_graph_type}
+
+def render_stream_plots(source, specs, out_dir='reports', workers=None):
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.figure import Figure
+    from titanic_batch import set_labels
+    from titanic_graph import draw_graph
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for spec in specs:
+            aggregates = stream_graph_data(source, spec['graph_type'], spec['first_feature'], spec.get('second_feature', ''),
+                                           spec.get('bins', 0), executor=executor)
+            figure = Figure(figsize=spec.get('figsize', (8, 6)))
+            ax = draw_graph(aggregates, spec.get('palette', 'deep'), ax=figure.add_subplot())
+            set_labels(ax, spec)
+            path = os.path.join(out_dir, f"{spec['name']}.png")
+            figure.savefig(path)
+            paths.append(path)
+            print(path)
+    return paths
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render the Titanic plots from data too big to load at once')
+    parser.add_argument('--csv', default='train.csv')
+    parser.add_argument('--sqlite', help='stream from this SQLite database instead of the CSV')
+    parser.add_argument('--table', default='titanic_data')
+    parser.add_argument('--mongo-uri', help='stream from MongoDB instead of the CSV')
+    parser.add_argument('--db', default='Titanic-Data')
+    parser.add_argument('--collection', default='Titanic-V1')
+    parser.add_argument('--out', default='reports', help='directory to write the images to')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--graph', action='append', default=[],
+                        help="graph instead of the titanic.py ones: 'graph type,first feature[,second feature[,palette[,bins]]]'")
+    args = parser.parse_args(argv)
+    from titanic_batch import parse_graph
+
+    if args.sqlite:
+        source = {'kind': 'sqlite', 'path': args.sqlite, 'table': args.table}
+    elif args.mongo_uri:
+        source = {'kind': 'mongo', 'uri': args.mongo_uri, 'db': args.db, 'collection': args.collection}
+    else:
+        source = {'kind': 'csv', 'path': args.csv}
+    specs = [parse_graph(text) for text in args.graph] or STREAM_PLOTS
+    return render_stream_plots(source, specs, args.out, args.workers)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+import cProfile
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# render tracing for the GUIs - where the time goes on a user's machine without attaching a profiler
+# a render gets a RenderTrace, spans inside it time the stages (get_data, clean_data, query/aggregate,
+# create_graph, canvas_draw), and when the graph is on screen the PerfMonitor reports it to the console
+# with a rolling p50/p95. With --profile-slow, slow renders also leave a cProfile dump and a trace file
+# (chrome://tracing / Perfetto format) in PROFILE_DIR
+# only the standard library is imported, and span() is a no-op when nothing is being traced
+
+# renders the rolling p50/p95 is taken over
+ROLLING_RENDERS = 50
+# renders slower than this get their profile saved (with --profile-slow)
+SLOW_RENDER_SECONDS = 0.5
+PROFILE_DIR = '.titanic_profiles'
+
+# the trace the current thread is working for
+_local = threading.local()
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+class RenderTrace:
+    def __init__(self, label, monitor=None, profile=False):
+        self.label = label
+        self.monitor = monitor
+        self.start = time.perf_counter()
+        # (stage, start, seconds, thread name, depth)
+        self.spans = []
+        self.details = {}
+        self.profiles = [] if profile else None
+        self.finished = False
+        self.lock = threading.Lock()
+
+    def add(self, stage, start, seconds, depth=0):
+        with self.lock:
+            self.spans.append((stage, start, seconds, threading.current_thread().name, depth))
+
+    def stage_seconds(self):
+        # top level stages only, nested spans are already counted in their parent
+        totals = {}
+        for stage, _, seconds, _, depth in self.spans:
+            if depth == 0:
+                totals[stage] = totals.get(stage, 0) + seconds
+        return totals
+
+    def total_seconds(self):
+        # click to pixels, including time spent queued behind other renders
+        if not self.spans:
+            return 0.0
+        return max(start + seconds for _, start, seconds, _, _ in self.spans) - self.start
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        if self.monitor is not None:
+            self.monitor.finished(self)
+
+    def trace_events(self):
+        # Chrome trace event format - one complete ('X') event per span
+        events = []
+        for stage, start, seconds, thread_name, _ in self.spans:
+            events.append({'name': stage, 'ph': 'X', 'pid': os.getpid(), 'tid': thread_name,
+                           'ts': (start - self.start) * 1e6, 'dur': seconds * 1e6})
+        return {'traceEvents': events, 'otherData': dict(self.details, label=self.label)}
+
+@contextmanager
+def tracing(trace):
+    # everything this thread does inside the block is traced (and profiled) into trace
+    previous = current_trace(), getattr(_local, 'depth', 0)
+    _local.trace = trace
+    _local.depth = 0
+    profile = None
+    if trace is not None and trace.profiles is not None:
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler is running - this part just isn't profiled
+            profile = None
+    try:
+        yield trace
+    finally:
+        if profile is not None:
+            profile.disable()
+            with trace.lock:
+                trace.profiles.append(profile)
+        _local.trace, _local.depth = previous
+
+@contextmanager
+def span(stage):
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    depth = _local.depth
+    _local.depth = depth + 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(stage, start, time.perf_counter() - start, depth)
+        _local.depth = depth
+
+def note(**details):
+    # e.g. note(rows=891) - shown alongside the timings
+    trace = current_trace()
+    if trace is not None:
+        trace.details.update(details)
+
+def percentile(values, fraction):
+    # nearest rank, no numpy needed
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def wants_profile():
+    return '--profile-slow' in sys.argv
+
+class PerfMonitor:
+    def __init__(self, report=print, profile=False, slow_seconds=SLOW_RENDER_SECONDS,
+                 profile_dir=PROFILE_DIR, rolling=ROLLING_RENDERS):
+        self.report = report
+        self.profile = profile
+        self.slow_seconds = slow_seconds
+        self.profile_dir = profile_dir
+        self.totals = deque(maxlen=rolling)
+        self.renders = 0
+        self.lock = threading.Lock()
+
+    def start(self, label):
+        return RenderTrace(label, self, self.profile)
+
+    def finished(self, trace):
+        total = trace.total_seconds()
+        with self.lock:
+            self.totals.append(total)
+            self.renders += 1
+            totals = list(self.totals)
+        self.report(format_trace(trace, total))
+        self.report(f'  last {len(totals)}: p50 {percentile(totals, 0.5) * 1000:.0f} ms, '
+                    f'p95 {percentile(totals, 0.95) * 1000:.0f} ms')
+        if self.profile and total >= self.slow_seconds:
+            try:
+                self.report(f'  slow - profile saved to {self.dump(trace)}')
+            except OSError as e:
+                self.report(f'  slow - could not save profile: {e}')
+
+    def dump(self, trace):
+        # <name>.prof for pstats/snakeviz, <name>.trace.json for chrome://tracing or Perfetto
+        import pstats
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, f"render-{time.strftime('%Y%m%d-%H%M%S')}-{self.renders}")
+        with open(path + '.trace.json', 'w') as f:
+            json.dump(trace.trace_events(), f)
+        if trace.profiles:
+            stats = pstats.Stats(trace.profiles[0])
+            for profile in trace.profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(path + '.prof')
+        return path
+
+def format_trace(trace, total=None):
+    # 'Bar Plot Pclass Survived: 84 ms, 712 rows (query 61, create_graph 15, canvas_draw 8)'
+    total = trace.total_seconds() if total is None else total
+    stages = ', '.join(f'{stage} {seconds * 1000:.0f}' for stage, seconds in trace.stage_seconds().items())
+    rows = f", {trace.details['rows']} rows" if 'rows' in trace.details else ''
+    return f'{trace.label}: {total * 1000:.0f} ms{rows} ({stages})'